@@ -0,0 +1,241 @@
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import pygame
+from config import *
+from mixer import MixerEngine, SDLCallbackSink, PygameQueueSink
+from scope import ScopeRing
+from metrics import metrics
+
+# ---------------------- Audio engine process ----------------------
+# AUDIO_ENGINE = 'process' runs MixerEngine in a worker process with its own
+# GIL, so a slow frame or a cache miss in the UI can't hold up the audio
+# callback. The UI writes note commands into a shared-memory ring; the
+# worker's audio callback drains it at the start of every block, renders,
+# and publishes meter levels and onset latencies back through a second ring
+# and the mixed samples through a shared ScopeRing. Every ring has exactly
+# one writer and one reader and nobody ever waits on the other side: a full
+# ring drops (and counts) the record instead. A worker that dies, or never
+# opens its device within PROCESS_READY_TIMEOUT, shows up as `failed`.
+NOTE_ON, NOTE_OFF, PANIC, VOLUME, SCOPE = 1, 2, 3, 4, 5
+METER, ONSET, READY, DROPPED = 1, 2, 3, 4
+
+COMMAND = np.dtype([('t', 'f8'), ('freq', 'f8'), ('volume', 'f8'), ('key', 'i8'), ('op', 'u1'), ('wave', 'u1')])
+TELEMETRY = np.dtype([('t', 'f8'), ('value', 'f8'), ('voices', 'i4'), ('kind', 'u1')])
+
+class ShmRing:
+    """Single-producer single-consumer ring of fixed-size records in shared memory.
+
+    The header holds two counters, records written and records read; each is
+    stored by one side only, after the record itself, so a plain aligned
+    64-bit store is all the synchronisation needed.
+    """
+    def __init__(self, dtype, capacity, name=None):
+        self.dtype, self.capacity = np.dtype(dtype), capacity
+        size = 16 + capacity * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.head = np.ndarray(2, dtype=np.uint64, buffer=self.shm.buf)   # [written, read]
+        self.recs = np.ndarray(capacity, dtype=self.dtype, buffer=self.shm.buf, offset=16)
+        if name is None:
+            self.head[:] = 0
+        self.dropped = 0
+        self._empty = np.zeros(0, dtype=self.dtype)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def put(self, rec):
+        """Append one record (a tuple in dtype field order); False if the ring is full."""
+        w = int(self.head[0])
+        if w - int(self.head[1]) >= self.capacity:
+            self.dropped += 1
+            return False
+        self.recs[w % self.capacity] = rec
+        self.head[0] = w + 1
+        return True
+
+    def get_all(self):
+        """Every record written since the last call, oldest first (a copy)."""
+        w, r = int(self.head[0]), int(self.head[1])
+        if w == r:
+            return self._empty
+        i, j = r % self.capacity, w % self.capacity
+        out = self.recs[i:j].copy() if i < j else np.concatenate((self.recs[i:], self.recs[:j]))
+        self.head[1] = w
+        return out
+
+    def close(self, unlink=False):
+        del self.head, self.recs   # release the buffer views before closing the mapping
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+class AudioProcess:
+    """UI-side handle with the MixerEngine interface main.py uses; the engine runs in a worker."""
+    def __init__(self, sample_rate=SAMPLE_RATE, block_size=MIXER_BLOCK, sink=MIXER_SINK):
+        self.sample_rate, self.block_size = sample_rate, block_size
+        self.commands = ShmRing(COMMAND, PROCESS_CMD_SLOTS)
+        self.telemetry = ShmRing(TELEMETRY, PROCESS_TEL_SLOTS)
+        self._scope_shm = shared_memory.SharedMemory(create=True, size=ScopeRing.nbytes())
+        self.shared_scope = ScopeRing(buffer=self._scope_shm.buf)
+        self.level = 0.0             # last published block peak
+        self.ready = False           # worker has opened its audio device
+        self.failed = None           # why the worker is gone (or never came up), else None
+        self._voices = 0
+        self._onsets = []
+        self._dropped = [0, 0]       # command / telemetry drops already counted in metrics
+        self._started = time.perf_counter()
+        ctx = multiprocessing.get_context('spawn')   # a fresh interpreter: no inherited SDL state
+        self._stop = ctx.Event()
+        self.proc = ctx.Process(target=_worker, name="audio-engine", daemon=True,
+                                args=(self.commands.name, self.telemetry.name, self._scope_shm.name,
+                                      self._stop, sample_rate, block_size, sink))
+        self.proc.start()
+
+    def _send(self, op, key=0, freq=0.0, wave=0, volume=0.0):
+        return self.commands.put((time.perf_counter(), freq, volume, key, op, wave))
+
+    def note_on(self, key, freq, wave, volume):
+        self._send(NOTE_ON, key, freq, wave, volume)
+        return RemoteVoice(self, key, volume)
+
+    def note_off(self, key):
+        self._send(NOTE_OFF, key)
+
+    def set_scope(self, on):
+        """Start or stop the worker copying every block into shared_scope."""
+        self._send(SCOPE, volume=float(on))
+
+    def panic(self):
+        self._send(PANIC)
+
+    @property
+    def active_voices(self):
+        return self._voices
+
+    def pump(self):
+        """Read what the worker published since the last frame, and check it is still there."""
+        tel_dropped = self._dropped[1]
+        for rec in self.telemetry.get_all():
+            kind = rec['kind']
+            if kind == METER:
+                self.level, self._voices = float(rec['value']), int(rec['voices'])
+            elif kind == ONSET:
+                self._onsets.append(float(rec['value']))
+            elif kind == READY:
+                self.ready = True
+            elif kind == DROPPED:
+                tel_dropped = max(tel_dropped, int(rec['value']))
+        for i, (name, n) in enumerate((('process_cmd_dropped', self.commands.dropped),
+                                       ('process_tel_dropped', tel_dropped))):
+            if n > self._dropped[i]:
+                metrics.incr(name, n - self._dropped[i])
+                self._dropped[i] = n
+        if self.failed is None:
+            if not self.proc.is_alive():
+                self.failed = f"audio worker exited (code {self.proc.exitcode})"
+            elif not self.ready and time.perf_counter() - self._started > PROCESS_READY_TIMEOUT:
+                self.failed = f"audio worker not ready after {PROCESS_READY_TIMEOUT:.0f} s"
+
+    def drain_onsets(self):
+        out, self._onsets = self._onsets, []
+        return out
+
+    def close(self, timeout=2.0):
+        self._stop.set()
+        self.proc.join(timeout)
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.shared_scope = None
+        try:
+            self._scope_shm.close()
+        except BufferError:
+            pass  # a ScopeView still holds the ring; the mapping goes with the process
+        self._scope_shm.unlink()
+        self.commands.close(unlink=True)
+        self.telemetry.close(unlink=True)
+
+class RemoteVoice:
+    """Channel-like handle for a note in the worker (see VoiceHandle)."""
+    def __init__(self, proc, key, volume):
+        self.proc, self.key, self.volume = proc, key, volume
+
+    def set_volume(self, volume):
+        if volume != self.volume:
+            self.volume = volume
+            self.proc._send(VOLUME, self.key, volume=volume)
+
+    def fadeout(self, ms=None):
+        self.proc.note_off(self.key)
+
+    def get_queue(self):
+        return None
+
+# ---------------------- Worker side ----------------------
+class _WorkerEngine(MixerEngine):
+    """MixerEngine that applies queued commands and publishes telemetry around every block."""
+    def __init__(self, commands, telemetry, shared_scope, **kw):
+        super().__init__(**kw)
+        self.commands, self.telemetry = commands, telemetry
+        self.shared_scope = shared_scope   # attached to self.scope only while the UI shows it
+        self._reported = 0                 # telemetry drops already published
+
+    def render_block(self):
+        for c in self.commands.get_all():
+            op, key = c['op'], int(c['key'])
+            if op == NOTE_ON:
+                self.note_on(key, float(c['freq']), int(c['wave']), float(c['volume']), sent_at=float(c['t']))
+            elif op == NOTE_OFF:
+                self.note_off(key)
+            elif op == SCOPE:
+                self.scope = self.shared_scope if c['volume'] else None
+            elif op == PANIC:
+                self.panic()
+            elif op == VOLUME:
+                slot = self.by_key.get(key)
+                if slot is not None:
+                    self.set_volume(slot, float(c['volume']))
+        block = super().render_block()
+        now = time.perf_counter()
+        for dt in self.drain_onsets():
+            self.telemetry.put((now, dt, 0, ONSET))
+        self.telemetry.put((now, float(np.max(np.abs(block))), self.active_voices, METER))
+        dropped = self.telemetry.dropped
+        if dropped > self._reported and self.telemetry.put((now, float(dropped), 0, DROPPED)):
+            self._reported = dropped
+        return block
+
+def open_device(engine, kind=MIXER_SINK):
+    """The worker's own output: SDL callback (audio subsystem only, no window), else a mixer channel."""
+    if kind == 'callback':
+        try:
+            from pygame._sdl2 import sdl2
+            sdl2.init_subsystem(sdl2.INIT_AUDIO)
+            return SDLCallbackSink(engine)
+        except Exception:
+            pass
+    pygame.mixer.init(engine.sample_rate, BITSIZE, CHANNELS, AUDIO_BUFFER)
+    pygame.mixer.set_reserved(1)
+    return PygameQueueSink(pygame.mixer.Channel(0))
+
+def _worker(cmd_name, tel_name, scope_name, stop, sample_rate, block_size, sink):
+    commands = ShmRing(COMMAND, PROCESS_CMD_SLOTS, name=cmd_name)
+    telemetry = ShmRing(TELEMETRY, PROCESS_TEL_SLOTS, name=tel_name)
+    scope_shm = shared_memory.SharedMemory(name=scope_name)
+    engine = _WorkerEngine(commands, telemetry, ScopeRing(buffer=scope_shm.buf),
+                           sample_rate=sample_rate, block_size=block_size)
+    engine.sink = open_device(engine, sink)
+    telemetry.put((time.perf_counter(), 0.0, 0, READY))
+    parent = multiprocessing.parent_process()
+    # callback sinks render on SDL's thread; push sinks need feeding from here
+    push = not isinstance(engine.sink, SDLCallbackSink)
+    while not stop.wait(0.002 if push else 0.1) and parent.is_alive():
+        if push:
+            engine.pump()
+    engine.close()
+    engine.scope = engine.shared_scope = None
+    scope_shm.close()
+    commands.close()
+    telemetry.close()
@@ -0,0 +1,57 @@
+import time
+import argparse
+import numpy as np
+from sessions import synthetic_events  # noqa: F401  (puts the repo root on sys.path)
+from config import *
+from effects import PartitionedConvolver, direct_convolve, synthetic_impulse
+
+# ---------------------- FFT vs direct convolution ----------------------
+# Direct convolution costs len(x) * len(ir) multiply-adds; the partitioned FFT
+# path costs about 2 FFTs + len(ir)/P spectrum products per P input samples.
+# Direct runs are skipped past --direct-limit multiply-adds and extrapolated
+# from the largest measured rate instead (marked ~).
+def fft_convolve(x, ir, partition, block):
+    conv = PartitionedConvolver(ir, partition)
+    out = [conv.process(x[i:i + block]) for i in range(0, len(x), block)]
+    out.append(conv.flush())
+    return np.concatenate(out)
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    y = fn(*args)
+    return time.perf_counter() - t0, y
+
+def main():
+    ap = argparse.ArgumentParser(description="Partitioned FFT convolution vs direct convolution.")
+    ap.add_argument("--seconds", type=float, nargs="+", default=[1.0, 10.0, 60.0], help="signal lengths")
+    ap.add_argument("--ir", type=float, nargs="+", default=[0.1, 0.5, 2.0], help="impulse response lengths")
+    ap.add_argument("--partition", type=int, default=FX_PARTITION)
+    ap.add_argument("--block", type=int, default=RENDER_BLOCK, help="renderer block size fed to the convolver")
+    ap.add_argument("--direct-limit", type=float, default=2e9, help="largest direct run (multiply-adds)")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    direct_rate = None  # multiply-adds per second, from the largest direct run so far
+    print(f"partition={args.partition} block={args.block}")
+    print(f"{'signal':>8} {'ir':>6} {'direct':>12} {'fft':>10} {'speedup':>9} {'max err':>9}")
+    for secs in args.seconds:
+        x = rng.standard_normal(int(secs * SAMPLE_RATE)).astype(np.float32)
+        for ir_secs in args.ir:
+            ir = synthetic_impulse(ir_secs)
+            t_fft, y = timed(fft_convolve, x, ir, args.partition, args.block)
+            macs = len(x) * len(ir)
+            if macs <= args.direct_limit:
+                t_dir, ref = timed(direct_convolve, x.astype(np.float64), ir)
+                direct_rate = macs / t_dir
+                err = f"{np.max(np.abs(y - ref)):9.1e}"
+                shown = f"{t_dir:11.3f}s"
+            elif direct_rate:
+                t_dir, err = macs / direct_rate, "        -"
+                shown = f"~{t_dir:10.1f}s"
+            else:
+                t_dir, err, shown = None, "        -", "          -"
+            speedup = f"{t_dir / t_fft:8.1f}x" if t_dir else "        -"
+            print(f"{secs:7.1f}s {ir_secs:5.1f}s {shown} {t_fft:9.3f}s {speedup} {err}")
+
+if __name__ == "__main__":
+    main()
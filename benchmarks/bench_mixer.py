@@ -0,0 +1,54 @@
+import time
+import argparse
+import numpy as np
+from sessions import synthetic_events
+from config import *
+from mixer import MixerEngine, NullSink, WavSink
+
+# ---------------------- Mixer engine throughput ----------------------
+def run(n_voices, n_blocks, block_size, steal):
+    engine = MixerEngine(block_size=block_size, max_voices=n_voices, steal=steal, sink=NullSink())
+    ev = synthetic_events(n_voices, seed=n_voices)
+    for k, e in enumerate(ev):
+        engine.note_on(k, float(e['freq']), int(e['wave']), float(e['volume']))
+    t0 = time.process_time()
+    for _ in range(n_blocks):
+        engine.process()
+    cpu = time.process_time() - t0
+    block_ms = 1000.0 * block_size / engine.sample_rate
+    per_block = 1000.0 * cpu / n_blocks
+    return per_block, per_block / block_ms, n_voices * n_blocks / (1000.0 * cpu)
+
+def main():
+    ap = argparse.ArgumentParser(description="Headless MixerEngine benchmark (NullSink).")
+    ap.add_argument("--voices", type=int, nargs="+", default=[1, 8, 16, 32, 64, 128])
+    ap.add_argument("--blocks", type=int, default=2000)
+    ap.add_argument("--block-size", type=int, default=MIXER_BLOCK)
+    ap.add_argument("--steal", default=VOICE_STEAL)
+    ap.add_argument("--wav", help="also render a 10 s stress take with voice stealing to this WAV")
+    args = ap.parse_args()
+
+    print(f"block={args.block_size} samples ({1000.0 * args.block_size / SAMPLE_RATE:.2f} ms)")
+    for v in args.voices:
+        per_block, load, vpms = run(v, args.blocks, args.block_size, args.steal)
+        print(f"voices={v:<4d} {per_block * 1000:8.1f} us/block  load {100 * load:6.1f}%  "
+              f"{vpms:8.1f} voice-blocks per CPU ms")
+
+    if args.wav:
+        sink = WavSink(args.wav)
+        engine = MixerEngine(block_size=args.block_size, sink=sink, steal=args.steal)
+        ev = synthetic_events(400, notes_per_sec=40)
+        starts = (ev['start'] * SAMPLE_RATE).astype(int)
+        ends = (ev['end'] * SAMPLE_RATE).astype(int)
+        for b in range(int(10 * SAMPLE_RATE) // args.block_size):
+            t0, t1 = b * args.block_size, (b + 1) * args.block_size
+            for k in np.flatnonzero((starts >= t0) & (starts < t1)):
+                engine.note_on(int(k), float(ev['freq'][k]), int(ev['wave'][k]), float(ev['volume'][k]) / 4)
+            for k in np.flatnonzero((ends >= t0) & (ends < t1)):
+                engine.note_off(int(k))
+            engine.process()
+        sink.close()
+        print(f"wrote {args.wav}, {engine.voices_stolen} voices stolen")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")   # the dummy device still pulls blocks in real time
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import time
+import argparse
+import numpy as np
+from sessions import synthetic_events  # noqa: F401  (puts the repo root on sys.path)
+from config import *
+from mixer import MixerEngine
+from audio_process import AudioProcess, open_device
+
+# ---------------------- Onset jitter vs UI load ----------------------
+# A fake UI loop runs at FRAME_RATE, burns `load` ms of pure-Python work per
+# frame (holding the GIL, like a slow Visualizer.draw) and strikes a note
+# every few frames. Onset latency is the time from note_on to the start of
+# the render of the block holding the note's first sample. With the engine
+# on the UI process's audio thread ('thread') the callback has to win the
+# GIL back first; in its own process ('process') it never competes for it.
+def burn(ms):
+    end = time.perf_counter() + ms / 1e3
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+def run(mode, load_ms, seconds, notes_per_sec):
+    if mode == 'process':
+        engine = AudioProcess(sink='callback')
+        while not engine.ready:
+            engine.pump(); time.sleep(0.01)
+    else:
+        engine = MixerEngine()
+        engine.sink = open_device(engine, 'callback')
+    frame = 1.0 / FRAME_RATE
+    every = max(1, round(FRAME_RATE / notes_per_sec))
+    lat = []
+    for i in range(int(seconds * FRAME_RATE)):
+        t0 = time.perf_counter()
+        key = i // every
+        if i % every == 0:
+            engine.note_on(key, 220.0 * (1 + key % 12 / 12), WAVE_SINE, 0.3)
+            engine.note_off(key - 2)
+        burn(load_ms)
+        engine.pump()
+        lat += engine.drain_onsets()
+        time.sleep(max(0.0, frame - (time.perf_counter() - t0)))
+    time.sleep(0.05)
+    engine.pump()
+    lat += engine.drain_onsets()
+    engine.close()
+    return 1e3 * np.array(lat)
+
+def main():
+    ap = argparse.ArgumentParser(description="Note onset latency/jitter with the engine in-process vs in its own process.")
+    ap.add_argument("--load", type=float, nargs="+", default=[0.0, 5.0, 10.0, 20.0], help="UI work per frame (ms)")
+    ap.add_argument("--modes", nargs="+", default=['thread', 'process'])
+    ap.add_argument("--seconds", type=float, default=4.0)
+    ap.add_argument("--rate", type=float, default=15.0, help="notes per second")
+    args = ap.parse_args()
+
+    block_ms = 1e3 * MIXER_BLOCK / SAMPLE_RATE
+    print(f"block={MIXER_BLOCK} samples ({block_ms:.2f} ms): an idle engine shows ~uniform 0..{block_ms:.1f} ms")
+    print(f"{'mode':<8} {'load':>6} {'notes':>6} {'p50':>7} {'p99':>7} {'max':>7} {'std':>7}  (ms)")
+    for mode in args.modes:
+        for load in args.load:
+            lat = run(mode, load, args.seconds, args.rate)
+            if not len(lat):
+                print(f"{mode:<8} {load:5.1f}ms  no onsets (no audio device?)")
+                continue
+            p50, p99 = np.percentile(lat, (50, 99))
+            print(f"{mode:<8} {load:5.1f}ms {len(lat):6d} {p50:7.2f} {p99:7.2f} {lat.max():7.2f} {lat.std():7.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from sessions import synthetic_events
+from config import *
+from renderer import mix_blocks, write_wav, total_samples
+
+# ---------------------- Parallel render scaling ----------------------
+def main():
+    ap = argparse.ArgumentParser(description="Time write_wav() at increasing worker counts.")
+    ap.add_argument("--notes", type=int, default=20000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = ap.parse_args()
+
+    events = synthetic_events(args.notes)
+    audio_secs = total_samples(events) / SAMPLE_RATE
+    serial = np.concatenate(list(mix_blocks(events, workers=1)))
+    print(f"{args.notes} notes, {audio_secs:.1f} s of audio, {os.cpu_count()} cores")
+    base = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for w in args.workers:
+            mix = np.concatenate(list(mix_blocks(events, workers=w)))
+            t0 = time.perf_counter()
+            write_wav(os.path.join(tmp, f"w{w}.wav"), events, workers=w)
+            dt = time.perf_counter() - t0
+            base = base or dt
+            print(f"workers={w:<3d} {dt:7.2f} s  x{base / dt:5.2f}  {audio_secs / dt:7.1f} audio-s/s  "
+                  f"bit-identical={np.array_equal(mix, serial)}")
+
+if __name__ == "__main__":
+    main()
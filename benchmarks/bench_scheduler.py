@@ -0,0 +1,90 @@
+import os
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")   # the dummy device still pulls blocks in real time
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import time
+import argparse
+import numpy as np
+from sessions import synthetic_events  # noqa: F401  (puts the repo root on sys.path)
+from config import *
+from mixer import MixerEngine
+from audio_process import open_device
+from scheduler import Scheduler, Arpeggiator, Metronome
+
+# ---------------------- Scheduled onset accuracy ----------------------
+# A fake UI loop with jittery frames (random sleep + busy work around
+# FRAME_RATE) drives an arpeggiator and a metronome at high rates against a
+# real-time audio device. Onset error is the sample a voice actually starts
+# at (MixerEngine.started) minus the sample it was meant to start at, in ms.
+# 'scheduled' hands notes over SCHED_LOOKAHEAD ahead with their sample
+# offsets; 'frame' is the naive loop that calls note_on once a note is due.
+# For 'scheduled' this is where schedule() placed the voice, which is exact
+# unless a note was late; check_scheduler.py checks the rendered audio itself.
+def frame_work(rng, jitter_ms):
+    end = time.perf_counter() + rng.uniform(0, jitter_ms) / 1e3
+    while time.perf_counter() < end:
+        pass
+
+def run(mode, rate, seconds, jitter_ms, lookahead, seed=0):
+    engine = MixerEngine(max_voices=64)
+    engine.sink = open_device(engine, 'callback')
+    sched = Scheduler(engine, lookahead=lookahead)
+    arp = Arpeggiator(rate=rate, gate=0.3)
+    for i, midi in enumerate((60, 64, 67, 71)):
+        arp.hold(i, 440.0 * 2 ** ((midi - 69) / 12), WAVE_SAW, 0.1)
+    sources = [arp, Metronome(bpm=8 * 60, volume=0.1)]
+    rng = np.random.default_rng(seed)
+    intended = {}   # key -> sample
+    if mode == 'scheduled':
+        for src in sources:
+            sched.add(src)
+    else:
+        origin = engine.samples_rendered
+        for src in sources:
+            src.start(origin, engine.sample_rate)
+        due, filled, n = [], origin, 0
+    frame = 1.0 / FRAME_RATE
+    t_end = time.perf_counter() + seconds
+    while time.perf_counter() < t_end:
+        t0 = time.perf_counter()
+        if mode == 'scheduled':
+            intended.update(sched.pump())
+        else:
+            now = engine.samples_rendered
+            for src in sources:
+                due += [(s, f, w, v) for s, e, f, w, v in src.notes(filled, now)]
+            filled = max(filled, now)
+            for s, f, w, v in due:
+                key = ('frame', n); n += 1
+                engine.note_on(key, f, w, v)
+                intended[key] = s
+            due = []
+        frame_work(rng, jitter_ms)
+        time.sleep(max(0.0, frame - (time.perf_counter() - t0)) + rng.uniform(0, jitter_ms) / 1e3)
+    time.sleep(lookahead + 0.05)   # let the last handed-over notes start
+    engine.close()
+    err = np.array([s - intended[k] for k, s in list(engine.started) if k in intended])
+    return 1e3 * err / engine.sample_rate, sched.late, sched.dropped
+
+def main():
+    ap = argparse.ArgumentParser(description="Onset accuracy of scheduled vs frame-triggered notes (headless).")
+    ap.add_argument("--rate", type=float, nargs="+", default=[32.0, 128.0], help="arpeggiator notes per second")
+    ap.add_argument("--seconds", type=float, default=4.0)
+    ap.add_argument("--jitter", type=float, default=8.0, help="random extra frame time, ms (x2: work + sleep)")
+    ap.add_argument("--lookahead", type=float, default=SCHED_LOOKAHEAD)
+    args = ap.parse_args()
+
+    print(f"frame {1e3 / FRAME_RATE:.1f} ms + up to {2 * args.jitter:.0f} ms jitter, block {MIXER_BLOCK} samples, "
+          f"lookahead {1e3 * args.lookahead:.0f} ms; metronome at 8 beats/s")
+    print(f"{'mode':<10} {'rate':>6} {'notes':>6} {'p50':>7} {'p99':>7} {'max':>7} {'late':>5} {'drop':>5}  (onset error, ms)")
+    for rate in args.rate:
+        for mode in ('scheduled', 'frame'):
+            err, late, dropped = run(mode, rate, args.seconds, args.jitter, args.lookahead)
+            if not len(err):
+                print(f"{mode:<10} {rate:5.0f}/s  no onsets (no audio device?)")
+                continue
+            p50, p99 = np.percentile(np.abs(err), (50, 99))
+            print(f"{mode:<10} {rate:5.0f}/s {len(err):6d} {p50:7.3f} {p99:7.3f} {np.abs(err).max():7.3f} "
+                  f"{late if mode == 'scheduled' else '-':>5} {dropped if mode == 'scheduled' else '-':>5}")
+
+if __name__ == "__main__":
+    main()
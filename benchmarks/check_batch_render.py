@@ -0,0 +1,38 @@
+import sys
+import argparse
+import numpy as np
+from sessions import synthetic_events
+from config import *
+from renderer import render_range, note_spans, total_samples
+from utils import synth_note
+
+# ---------------------- Batched vs per-note render ----------------------
+# The block renderer (shared oscillator streams, cached envelope ramps,
+# slice-adds) must match the plain per-note path it replaced: every note
+# synthesized on its own with utils.synth_note() and summed at its start
+# sample. Exits non-zero when the two differ by more than --tol.
+def per_note_mix(events, sample_rate=SAMPLE_RATE):
+    out = np.zeros(total_samples(events, sample_rate), dtype=np.float64)
+    starts, lengths, durs = note_spans(events, sample_rate)
+    for e, s, n, d in zip(events, starts, lengths, durs):
+        out[s:s + n] += synth_note(int(e['wave']), float(e['freq']), float(d), float(e['volume']))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Check the batched renderer against a per-note synth_note() sum.")
+    ap.add_argument("--notes", type=int, default=300)
+    ap.add_argument("--tol", type=float, default=1e-5, help="max absolute sample difference")
+    args = ap.parse_args()
+
+    events = synthetic_events(args.notes)
+    ref = per_note_mix(events)
+    mix = render_range(events, 0.0, len(ref) / SAMPLE_RATE)
+    n = min(len(ref), len(mix))
+    err = float(np.max(np.abs(mix[:n] - ref[:n]))) if n else 0.0
+    ok = len(mix) == len(ref) and err <= args.tol
+    print(f"{args.notes} notes, {len(ref)} samples: max |batched - per-note| = {err:.2e} "
+          f"(tol {args.tol:.0e}, lengths {len(mix)}/{len(ref)}) {'OK' if ok else 'FAIL'}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
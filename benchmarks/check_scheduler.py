@@ -0,0 +1,87 @@
+import sys
+import argparse
+import numpy as np
+from sessions import synthetic_events  # noqa: F401  (puts the repo root on sys.path)
+from config import *
+from mixer import MixerEngine
+from scheduler import Scheduler, Arpeggiator, Metronome
+
+# ---------------------- Scheduled onsets in the rendered audio ----------------------
+# Headless, on a simulated clock: a jittery frame loop pumps the scheduler
+# while the "device" pulls one block ahead of wall time from a NullSink
+# engine. Every handover is then replayed alone in a fresh engine at the same
+# engine clock; the solo renders must add up to the live mix (so nothing was
+# stolen or moved), and each note's first non-zero sample must be within --tol
+# of the sample it was scheduled for. Exits non-zero otherwise.
+class TapEngine(MixerEngine):
+    """MixerEngine that remembers every schedule() call with the clock it arrived at."""
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.handed = []
+
+    def schedule(self, key, freq, wave, volume, start, end):
+        self.handed.append((self.samples_rendered, freq, wave, volume, start, end))
+        return super().schedule(key, freq, wave, volume, start, end)
+
+def live_run(rate, seconds, jitter_ms, lookahead, max_voices, seed=0):
+    engine = TapEngine(max_voices=max_voices)
+    sched = Scheduler(engine, lookahead=lookahead)
+    arp = sched.add(Arpeggiator(rate=rate, gate=0.3))
+    for i, midi in enumerate((60, 64, 67, 71)):
+        arp.hold(i, 440.0 * 2 ** ((midi - 69) / 12), WAVE_SAW, 0.1)
+    sched.add(Metronome(bpm=8 * 60, volume=0.1))
+    rng = np.random.default_rng(seed)
+    sr, B = engine.sample_rate, engine.block_size
+    out, t = [], 0.0
+    while t < seconds:
+        sched.pump()
+        t += 1.0 / FRAME_RATE + rng.uniform(0, 2 * jitter_ms) / 1e3
+        while engine.samples_rendered < t * sr + B:   # the device's pulls while the frame ran
+            out.append(engine.render_block())
+    for _ in range(int(0.5 * sr) // B):   # let the last notes ring out
+        out.append(engine.render_block())
+    return engine, np.concatenate(out), sched
+
+def solo(now, freq, wave, volume, start, end, length, max_voices):
+    """One handover replayed alone; returns its audio on the live run's sample axis."""
+    engine = MixerEngine(max_voices=max_voices)
+    engine.samples_rendered = now
+    engine.schedule('solo', freq, wave, volume, start, end)
+    out = np.zeros(length, dtype=np.float64)
+    while engine.active_voices and engine.samples_rendered < length:
+        b0 = engine.samples_rendered
+        block = engine.render_block()
+        out[b0:b0 + len(block)] = block[:length - b0]
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Check scheduled notes start on their sample in the rendered audio.")
+    ap.add_argument("--rate", type=float, nargs="+", default=[32.0, 128.0], help="arpeggiator notes per second")
+    ap.add_argument("--seconds", type=float, default=4.0)
+    ap.add_argument("--jitter", type=float, default=8.0, help="random extra frame time, ms (x2)")
+    ap.add_argument("--lookahead", type=float, default=SCHED_LOOKAHEAD)
+    ap.add_argument("--tol", type=float, default=1.0, help="max onset error, ms")
+    args = ap.parse_args()
+
+    ok = True
+    for rate in args.rate:
+        voices = 64
+        engine, mix, sched = live_run(rate, args.seconds, args.jitter, args.lookahead, voices)
+        total = np.zeros(len(mix))
+        err = []
+        for now, freq, wave, volume, start, end in engine.handed:
+            audio = solo(now, freq, wave, volume, start, end, len(mix), voices)
+            total += audio
+            hit = np.flatnonzero(audio)
+            err.append(hit[0] - start if len(hit) else np.inf)
+        err = 1e3 * np.abs(np.array(err)) / engine.sample_rate
+        diff = float(np.max(np.abs(total - mix)))
+        good = len(err) > 0 and err.max() <= args.tol and diff <= 1e-5 and engine.voices_stolen == 0
+        ok &= good
+        print(f"rate {rate:5.0f}/s + metronome 8/s: {len(err)} notes, onset error max {err.max():.3f} ms "
+              f"(tol {args.tol:.1f}), |solo sum - mix| {diff:.1e}, late {sched.late}, dropped {sched.dropped}, "
+              f"stolen {engine.voices_stolen}  {'OK' if good else 'FAIL'}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")   # headless: no window, no sound card
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+import numpy as np
+from sessions import synthetic_events
+import pygame
+import config
+from config import *
+import utils
+from recording import Recorder
+from renderer import IntervalIndex, render_range
+from effects import build_chain, apply_chain
+from visualizer import Visualizer
+from piano_mapping import build_keymap
+
+# ---------------------- Benchmark suite ----------------------
+# python benchmarks/run.py --save benchmarks/baseline.json
+# python benchmarks/run.py --compare benchmarks/baseline.json [--threshold 0.2]
+# main.py --startup-report prints the in-process startup_window and
+# time_to_first_sound figures (also in metrics_report.json) for a single launch.
+# Each case reports the median and min of several timed repeats (seconds);
+# --compare checks the min (least sensitive to scheduler noise) and fails
+# (exit 1) when a case regresses past the threshold.
+CASES = []
+
+def case(name, repeats=7, heavy=False):
+    def deco(fn):
+        CASES.append((name, fn, repeats, heavy))
+        return fn
+    return deco
+
+def _time(fn, repeats):
+    """Wall-clock seconds of each of `repeats` calls to fn()."""
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+# ---------- Synthesis ----------
+for secs in (0.1, 1.0, 10.0):
+    wave = np.ones(int(SAMPLE_RATE * secs))
+    case(f"apply_envelope[{secs:g}s]")(lambda wave=wave: utils.apply_envelope(
+        wave, SAMPLE_RATE, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE))
+    case(f"synth_note[{secs:g}s]")(lambda secs=secs: utils.synth_note(WAVE_SAW, 440.0, secs, 0.6))
+
+@case("gen_waveform[cold]")
+def _gen_cold():
+    utils.sound_cache.clear()
+    utils.gen_waveform(WAVE_SQUARE, 523.25)
+
+@case("gen_waveform[warm]", repeats=200)
+def _gen_warm():
+    utils.gen_waveform(WAVE_SQUARE, 523.25)
+
+# ---------- Offline rendering ----------
+_renders = {}  # n notes -> Recorder, built on first use
+
+def _recorder_with(events):
+    rec = Recorder()
+    rec.take_name = "bench"
+    for e in events:
+        idx = rec.events.append(e['start'], e['freq'], e['wave'], e['volume'])
+        rec.events.close(idx, e['end'])
+    return rec
+
+for n, reps, heavy in ((100, 5, False), (10_000, 3, False), (100_000, 1, True)):
+    def _render(n=n):
+        if n not in _renders:
+            _renders[n] = _recorder_with(synthetic_events(n))
+        rec = _renders[n]
+        with tempfile.TemporaryDirectory() as tmp:
+            rec.render_to_wav(os.path.join(tmp, "bench.wav"))
+    case(f"render_to_wav[{n} notes]", repeats=reps, heavy=heavy)(_render)
+
+_range_index = {}  # n notes -> (events, IntervalIndex)
+
+for n in (10_000, 100_000):
+    def _preview(n=n):
+        if n not in _range_index:
+            ev = synthetic_events(n)
+            _range_index[n] = (ev, IntervalIndex(ev))
+        ev, index = _range_index[n]
+        mid = n / 16.0  # middle of the take (8 notes/s)
+        render_range(ev, mid, mid + 5.0, index=index)
+    case(f"render_range[5s of {n} notes]", repeats=5)(_preview)
+
+# ---------- Effects ----------
+_fx_input = [np.random.default_rng(0).standard_normal(RENDER_BLOCK).astype(np.float32)
+             for _ in range(int(10 * SAMPLE_RATE) // RENDER_BLOCK)]
+
+@case("fx chain[10s, room reverb + delay]", repeats=3)
+def _fx():
+    for _ in apply_chain(iter(_fx_input), build_chain(reverb_ir='room', delay=0.3)):
+        pass
+
+# ---------- Drawing ----------
+_viz = None
+
+@case("Visualizer.draw[8 keys]", repeats=200)
+def _draw():
+    global _viz
+    if _viz is None:
+        screen = pygame.display.set_mode((920, 440))
+        _viz = Visualizer(screen, build_keymap(BASE_OCTAVE))
+        for k in "zxcvqwe2":
+            _viz.note_on(ord(k), 440.0, WAVE_SINE, 0.6)
+    _viz.draw(BASE_OCTAVE, WAVE_SINE, 0.6, False, True, status_msg="bench")
+
+# ---------- Startup ----------
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@case("startup[until fully prewarmed]", repeats=3)
+def _startup():
+    # whole process: launch, window, and the full prewarm (--startup-report exits once every note is built)
+    subprocess.run([sys.executable, os.path.join(_ROOT, "main.py"), "--startup-report"],
+                   cwd=_ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+# ---------- Driver ----------
+def run(include_heavy, only=None):
+    results = {}
+    for name, fn, repeats, heavy in CASES:
+        if (heavy and not include_heavy) or (only and only not in name):
+            continue
+        fn()  # warm-up (also builds lazily cached inputs)
+        times = _time(fn, repeats)
+        results[name] = {'median': statistics.median(times), 'min': min(times), 'repeats': repeats}
+        print(f"{name:<32} median {1e3 * results[name]['median']:10.3f} ms   min {1e3 * results[name]['min']:10.3f} ms")
+    return results
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, r in results.items():
+        b = baseline['results'].get(name)
+        if not b:
+            continue
+        ratio = r['min'] / b['min']
+        flag = "REGRESSION" if ratio > 1.0 + threshold else ""
+        print(f"{name:<32} x{ratio:6.2f} vs baseline {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark synthesis, rendering and drawing hot paths.")
+    ap.add_argument("--save", help="write results as a baseline JSON")
+    ap.add_argument("--compare", help="baseline JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    ap.add_argument("--heavy", action="store_true", help="include the 100k-note render")
+    ap.add_argument("-k", dest="only", help="only run cases whose name contains this")
+    args = ap.parse_args()
+
+    config.USE_DISK_CACHE = utils.USE_DISK_CACHE = False  # cold cases must really synthesize
+    pygame.init()
+    results = run(args.heavy, args.only)
+    if args.save:
+        meta = {'python': platform.python_version(), 'numpy': np.__version__,
+                'pygame': pygame.version.ver, 'machine': platform.platform(), 'cpus': os.cpu_count()}
+        with open(args.save, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+        print(f"saved {args.save}")
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {100 * args.threshold:.0f}%: {', '.join(regressions)}")
+            status = 1
+    pygame.quit()
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import *
+from renderer import EVENT_DTYPE
+from utils import midi_to_freq
+
+# ---------------------- Synthetic sessions ----------------------
+def synthetic_events(n_notes, notes_per_sec=8.0, seed=0):
+    """Reproducible performance: n_notes over n_notes/notes_per_sec seconds, C3..C6, all waves."""
+    rng = np.random.default_rng(seed)
+    ev = np.zeros(n_notes, dtype=EVENT_DTYPE)
+    ev['start'] = np.sort(rng.uniform(0.0, n_notes / notes_per_sec, n_notes))
+    ev['end'] = ev['start'] + rng.uniform(0.05, 1.5, n_notes)
+    ev['freq'] = midi_to_freq(rng.integers(48, 85, n_notes))
+    ev['wave'] = rng.integers(0, 3, n_notes)
+    ev['volume'] = rng.choice([0.4, 0.6, 0.8], n_notes)
+    return ev
@@ -18,8 +18,90 @@ ENV_DECAY = 0.08
 ENV_SUSTAIN = 0.85
 ENV_RELEASE = 0.12  # live fadeout approximates this
 
-# Simple cache for generated sounds: (wave, freq) -> pygame.Sound
-sound_cache = {}
+# Bump whenever synthesis code changes its output (invalidates the disk cache)
+SYNTH_VERSION = 2
+
+# On-disk cache of rendered note buffers (see note_cache.py)
+USE_DISK_CACHE = True
+NOTE_CACHE_DIR = ".note_cache"
+
+# Offline rendering (see renderer.py)
+RENDER_BLOCK = 1 << 16      # samples mixed and written per block
+RENDER_NORMALIZE = 'peak'   # 'peak' (rescale if clipping) or 'limit' (single-pass soft limiter)
+OSC_CACHE_SECONDS = 4.0     # per-pitch oscillator stream reused across notes
+RENDER_WORKERS = 1          # >1 renders time tiles in a process pool (0 = all cores)
+RENDER_TILE_BLOCKS = 16     # blocks per parallel tile
+RENDER_IN_BACKGROUND = True # mix notes on a worker thread while recording; stop() returns at once
+
+# Post-mix effects on rendered takes (see effects.py); all off by default
+FX_REVERB_IR = None         # impulse response WAV path, or 'room' for a synthetic one
+FX_REVERB_WET = 0.25
+FX_PARTITION = 4096         # reverb FFT partition size (samples)
+FX_DELAY_SECONDS = 0.0      # feedback delay time; 0 disables it
+FX_DELAY_FEEDBACK = 0.35
+FX_DELAY_WET = 0.3
+FX_DELAY_MAX_TAIL = 10.0    # longest echo ring-out after the take ends (seconds)
+FX_LIMIT = False            # soft limiter at the end of the chain
+
+# Crash-safe recording journal (see event_store.py); replay with render_cli.py
+USE_JOURNAL = True
+JOURNAL_DIR = "."
+KEEP_JOURNALS = False   # journals are deleted once the WAV is written
+JOURNAL_FSYNC = False   # True also survives power loss, at one fsync per note
+
+# Live audio engine: 'sound' plays a looping pygame.Sound per key on mixer
+# channels; 'mixer' renders every voice in mixer.MixerEngine with real ADSR;
+# 'process' runs that engine in its own process (see audio_process.py).
+AUDIO_ENGINE = 'sound'
+MIXER_BLOCK = AUDIO_BUFFER   # samples per engine block
+MAX_VOICES = 32              # polyphony limit before voice stealing
+VOICE_STEAL = 'oldest'       # 'oldest' or 'quietest' (released voices are stolen first)
+MIXER_SINK = 'callback'      # 'callback' (SDL audio thread) or 'queue' (pygame channel queue)
+PROCESS_CMD_SLOTS = 1024     # shared-memory command ring, UI -> audio process
+PROCESS_TEL_SLOTS = 4096     # meter/onset ring, audio process -> UI
+PROCESS_READY_TIMEOUT = 5.0  # seconds for the worker to open its device before falling back
+
+# Instrumentation (see metrics.py); F3 toggles the on-screen overlay
+METRICS_ENABLED = True
+METRICS_WINDOW = 2048                   # samples kept per stage for p50/p95/p99
+METRICS_REPORT = "metrics_report.json"  # written at exit (.json or .csv); None disables
+
+# Main loop: full frame rate only while notes sound or animate, else block on input
+FRAME_RATE = 90
+IDLE_WAIT_MS = 500
+
+# Adaptive visual quality (see frame_budget.py): drawing that overruns its share of
+# the frame sheds glow blending, then animation, then frame rate; input never waits
+FRAME_BUDGET = True
+FRAME_BUDGET_MS = 0.5 * 1000 / FRAME_RATE   # smoothed draw time per frame before quality drops
+FRAME_BUDGET_DOWN = 10      # frames over budget before stepping down a tier
+FRAME_BUDGET_UP = 90        # frames under half the budget before stepping back up
+
+# Visualizer: repaint only changed keys/meter/status via display.update(rects)
+VIZ_DIRTY_RECTS = True
+
+# Oscilloscope/spectrum panels (F4; see scope.py). Off costs nothing.
+SCOPE_ENABLED = False
+SCOPE_RING = 8192           # mixed samples kept for the panels (power of two)
+SCOPE_SAMPLES = 1024        # samples across the oscilloscope (~23 ms)
+SCOPE_FFT = 2048            # spectrum window
+SCOPE_DB_RANGE = 80.0       # spectrum floor below full scale
+
+# Live notes: one-shot attack/decay segment + a sustain loop re-queued every frame
+NOTE_LOOP_SECONDS = 0.15        # target loop length (snapped to a whole number of cycles)
+NOTE_HOLD_SECONDS = 0.5         # queued sustain, the loop repeated: a frame can stall this long without a gap
+SOUND_CACHE_BYTES = 32 << 20    # LRU budget for in-memory note Sounds (see utils.sound_cache)
+
+# Timed playback on the mixer's sample clock (see scheduler.py); F5/F6/F7 need AUDIO_ENGINE = 'mixer'
+SCHED_LOOKAHEAD = 0.05  # seconds of notes handed to the engine ahead of time
+SCHED_BPM = 120         # metronome tempo
+SCHED_ARP_RATE = 8.0    # arpeggiator notes per second
+SCHED_ARP_GATE = 0.5    # fraction of each step a note is held
+
+# Build every playable note in the background after the window opens (see prewarm.py)
+PREWARM = True
+PREWARM_WORKERS = 2     # buffer-building threads
+PREWARM_PER_FRAME = 8   # Sounds created per frame on the main thread
 
 # Track which keys are currently sustained/held
 active_channels = {}        # key -> pygame.Channel
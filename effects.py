@@ -0,0 +1,209 @@
+import wave
+import numpy as np
+from config import *
+
+# ---------------------- Post-mix effects ----------------------
+# Effects run on the mono float mix in whatever block sizes the renderer
+# produces. process(x) returns the output that is ready: the delay and the
+# limiter return len(x) samples, but the reverb only emits whole FX_PARTITION
+# frames, so its output lags the input by up to a partition and varies in
+# length from call to call. flush() yields what is left once the input ends
+# (held-back reverb frames and decay, echoes) in blocks, so over a whole run
+# output stays sample-aligned with input and a chain never holds more than
+# its own state, whatever the session length.
+
+def soft_limit(x, threshold=0.9):
+    """Leave |x| <= threshold untouched, squash the rest smoothly into (threshold, 1)."""
+    mag = np.abs(x)
+    over = mag > threshold
+    if np.any(over):
+        knee = 1.0 - threshold
+        x[over] = np.sign(x[over]) * (threshold + knee * np.tanh((mag[over] - threshold) / knee))
+    return x
+
+def load_impulse(path, sample_rate=SAMPLE_RATE):
+    """Impulse response from a PCM WAV (8/16/24/32-bit, channels averaged), at sample_rate, unit energy."""
+    with wave.open(path, 'rb') as wf:
+        n_ch, width, rate = wf.getnchannels(), wf.getsampwidth(), wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+    if width == 1:
+        x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128) / 128
+    elif width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        x = ((b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8) / float(1 << 23)
+    else:
+        x = np.frombuffer(raw, dtype={2: '<i2', 4: '<i4'}[width]) / float(1 << (8 * width - 1))
+    x = x.reshape(-1, n_ch).mean(axis=1)
+    if rate != sample_rate:
+        t = np.arange(int(len(x) * sample_rate / rate)) * (rate / sample_rate)
+        x = np.interp(t, np.arange(len(x)), x)
+    return _unit_energy(x)
+
+def synthetic_impulse(seconds=1.5, sample_rate=SAMPLE_RATE, decay_db=60.0, seed=0):
+    """Exponentially decaying noise: a plain room-ish IR when no WAV is configured."""
+    n = max(1, int(seconds * sample_rate))
+    rng = np.random.default_rng(seed)
+    env = 10.0 ** (-decay_db / 20.0 * np.arange(n) / n)
+    return _unit_energy(rng.standard_normal(n) * env)
+
+def _unit_energy(ir):
+    energy = np.sqrt(np.sum(ir * ir))
+    return ir / energy if energy > 0 else ir
+
+class PartitionedConvolver:
+    """Uniformly partitioned overlap-save convolution with a frequency-domain delay line.
+
+    The IR is cut into K partitions of P samples whose 2P-point spectra are
+    kept; each complete P-sample input frame costs one rfft, K complex
+    multiply-adds and one irfft, instead of P * len(ir) multiplies directly.
+    Output sample i belongs to input sample i, but is only emitted once its
+    P-sample frame is complete; flush() returns the rest, up to the full
+    len(ir) - 1 tail.
+    """
+    def __init__(self, ir, partition=FX_PARTITION):
+        P = self.P = partition
+        K = self.K = max(1, -(-len(ir) // P))
+        h = np.zeros(K * P)
+        h[:len(ir)] = ir
+        self.H = np.fft.rfft(h.reshape(K, P), n=2 * P, axis=1)
+        self.fdl = np.zeros_like(self.H)   # input frame spectra, ring indexed by self.pos
+        self.pos = 0
+        self.frame = np.zeros(2 * P)       # [previous P inputs, current P inputs]
+        self.pending = np.zeros(0)
+        self.ir_len = len(ir)
+        self.n_in = self.n_out = 0
+
+    def _step(self, x):
+        P, K = self.P, self.K
+        self.frame[:P] = self.frame[P:]
+        self.frame[P:] = x
+        self.pos = (self.pos - 1) % K
+        self.fdl[self.pos] = np.fft.rfft(self.frame)
+        # sum_k X[n-k] H[k]: the newest spectrum sits at pos, older ones follow it around the ring
+        p = self.pos
+        acc = np.einsum('kf,kf->f', self.fdl[p:], self.H[:K - p])
+        if p:
+            acc += np.einsum('kf,kf->f', self.fdl[:p], self.H[K - p:])
+        return np.fft.irfft(acc, 2 * P)[P:]
+
+    def process(self, x):
+        self.n_in += len(x)
+        buf = np.concatenate((self.pending, x)) if len(self.pending) else np.asarray(x, dtype=np.float64)
+        n = len(buf) // self.P
+        out = [self._step(buf[i * self.P:(i + 1) * self.P]) for i in range(n)]
+        self.pending = buf[n * self.P:]
+        y = np.concatenate(out) if out else np.zeros(0)
+        self.n_out += len(y)
+        return y
+
+    def flush(self):
+        need = self.n_in + self.ir_len - 1 - self.n_out
+        if need <= 0:
+            return np.zeros(0)
+        pad = -(-(len(self.pending) + need) // self.P) * self.P - len(self.pending)
+        n_in = self.n_in
+        y = self.process(np.zeros(pad))[:need]
+        self.n_in, self.n_out = n_in, n_in + self.ir_len - 1
+        return y
+
+def direct_convolve(x, ir):
+    """Reference time-domain convolution (what the FFT path replaces)."""
+    return np.convolve(x, ir)
+
+class Reverb:
+    """Dry signal plus wet partitioned convolution with an impulse response."""
+    def __init__(self, ir, wet=FX_REVERB_WET, dry=1.0, partition=FX_PARTITION):
+        self.conv = PartitionedConvolver(ir, partition)
+        self.wet, self.dry = wet, dry
+        self.dry_fifo = np.zeros(0)   # inputs whose convolved output is not out yet
+
+    def _mix(self, y):
+        d = self.dry_fifo[:len(y)]
+        self.dry_fifo = self.dry_fifo[len(y):]
+        if len(d) < len(y):
+            d = np.pad(d, (0, len(y) - len(d)))
+        return self.dry * d + self.wet * y
+
+    def process(self, x):
+        self.dry_fifo = np.concatenate((self.dry_fifo, x))
+        return self._mix(self.conv.process(x))
+
+    def flush(self):
+        yield self._mix(self.conv.flush())
+
+class FeedbackDelay:
+    """Echoes every `seconds`, each `feedback` times the last: y = x + wet * w[n-D], w = x + fb * w[n-D]."""
+    def __init__(self, seconds=FX_DELAY_SECONDS, feedback=FX_DELAY_FEEDBACK, wet=FX_DELAY_WET,
+                 sample_rate=SAMPLE_RATE, max_tail=FX_DELAY_MAX_TAIL):
+        self.D = max(1, int(seconds * sample_rate))
+        self.feedback, self.wet = feedback, wet
+        self.max_repeats = max(1, int(max_tail * sample_rate) // self.D)
+        self.hist = np.zeros(self.D)   # w over the last D samples, oldest first
+
+    def process(self, x):
+        out = np.empty(len(x))
+        # chunks of at most D samples only read history that already exists
+        for i in range(0, len(x), self.D):
+            c = x[i:i + self.D]
+            m = len(c)
+            delayed = self.hist[:m]
+            out[i:i + m] = c + self.wet * delayed
+            self.hist = np.concatenate((self.hist[m:], c + self.feedback * delayed))
+        return out
+
+    def flush(self):
+        # ring out one delay time at a time until the echoes are 60 dB down, or for at
+        # most max_tail seconds (high feedback), fading the last block out if cut short
+        fb = min(abs(self.feedback), 0.999)
+        repeats = int(np.ceil(np.log(1e-3) / np.log(fb))) if fb > 0 else 1
+        n = min(repeats, self.max_repeats)
+        silence = np.zeros(self.D)
+        for i in range(n):
+            y = self.process(silence)
+            if i == n - 1 and n < repeats:
+                y *= np.linspace(1.0, 0.0, len(y))
+            yield y
+
+class Limiter:
+    def __init__(self, threshold=0.9):
+        self.threshold = threshold
+
+    def process(self, x):
+        return soft_limit(np.array(x, dtype=np.float64), self.threshold)
+
+    def flush(self):
+        return iter(())
+
+def build_chain(sample_rate=SAMPLE_RATE, reverb_ir=FX_REVERB_IR, delay=FX_DELAY_SECONDS, limit=FX_LIMIT):
+    """Effects chain from the FX_* settings: reverb, then delay, then limiter (empty = dry).
+
+    reverb_ir is a WAV path, or 'room' for synthetic_impulse().
+    """
+    chain = []
+    if reverb_ir:
+        ir = synthetic_impulse(sample_rate=sample_rate) if reverb_ir == 'room' else load_impulse(reverb_ir, sample_rate)
+        chain.append(Reverb(ir))
+    if delay:
+        chain.append(FeedbackDelay(delay, sample_rate=sample_rate))
+    if limit:
+        chain.append(Limiter())
+    return chain
+
+def apply_chain(blocks, chain):
+    """Run float32 blocks through the chain; yields float32 blocks, then the chain's tail."""
+    if not chain:
+        yield from blocks
+        return
+    for block in blocks:
+        x = block
+        for fx in chain:
+            x = fx.process(x)
+        if len(x):
+            yield x.astype(np.float32)
+    # each effect's tail goes through the effects after it before the next one flushes
+    for i, fx in enumerate(chain):
+        for y in fx.flush():
+            for later in chain[i + 1:]:
+                y = later.process(y)
+            for j in range(0, len(y), RENDER_BLOCK):
+                yield y[j:j + RENDER_BLOCK].astype(np.float32)
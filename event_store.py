@@ -0,0 +1,106 @@
+import os
+import struct
+import numpy as np
+from config import *
+from renderer import EVENT_DTYPE
+
+# ---------------------- Columnar event store ----------------------
+class EventStore:
+    """Growable EVENT_DTYPE array (times in seconds from session start, end=NaN while open)."""
+    def __init__(self, capacity=1024):
+        self._buf = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self.n = 0
+        self.version = 0   # bumped on every change, for caches built over the events
+
+    def __len__(self):
+        return self.n
+
+    def clear(self):
+        self.n = 0
+        self.version += 1
+
+    def append(self, start, freq, wave, volume, end=np.nan):
+        if self.n == len(self._buf):
+            grown = np.zeros(2 * len(self._buf), dtype=EVENT_DTYPE)
+            grown[:self.n] = self._buf[:self.n]
+            self._buf = grown
+        self._buf[self.n] = (start, end, freq, wave, volume)
+        self.n += 1
+        self.version += 1
+        return self.n - 1
+
+    def close(self, idx, end):
+        """Set the end of an open event; returns False if it was already closed."""
+        if not np.isnan(self._buf['end'][idx]):
+            return False
+        self._buf['end'][idx] = end
+        self.version += 1
+        return True
+
+    def open_indices(self):
+        return np.flatnonzero(np.isnan(self._buf['end'][:self.n]))
+
+    def array(self):
+        """Live view of the stored events (no copy)."""
+        return self._buf[:self.n]
+
+    def finalized(self, now=None):
+        """Copy ready for the renderer: open events end at `now` (or 1 ms after start)."""
+        ev = self.array().copy()
+        ev['start'] = np.maximum(0.0, ev['start'])
+        open_ = np.isnan(ev['end'])
+        ev['end'][open_] = ev['start'][open_] + 0.001 if now is None else now
+        ev['end'] = np.maximum(ev['start'] + 0.001, ev['end'])
+        return ev
+
+# ---------------------- Append-only journal ----------------------
+# Fixed-size little-endian records after a small header. Each record is one
+# os.write() on an O_APPEND descriptor, so everything up to the last note is
+# in the OS page cache even if the process dies; a torn trailing record is
+# ignored on replay.
+JOURNAL_MAGIC = b'KPJ1'
+_HEADER = struct.Struct('<4sI')           # magic, sample rate
+_RECORD = struct.Struct('<BIddBd')        # kind, index, time, freq, wave, volume
+REC_ON, REC_OFF = 1, 2
+
+class EventJournal:
+    def __init__(self, path, sample_rate=SAMPLE_RATE, fsync=JOURNAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND | getattr(os, 'O_BINARY', 0)
+        self.fd = os.open(path, flags, 0o644)
+        os.write(self.fd, _HEADER.pack(JOURNAL_MAGIC, sample_rate))
+
+    def _write(self, rec):
+        os.write(self.fd, rec)
+        if self.fsync:
+            os.fsync(self.fd)
+
+    def note_on(self, idx, t, freq, wave, volume):
+        self._write(_RECORD.pack(REC_ON, idx, t, freq, wave, volume))
+
+    def note_off(self, idx, t):
+        self._write(_RECORD.pack(REC_OFF, idx, t, 0.0, 0, 0.0))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def replay_journal(path):
+    """Rebuild (EventStore, sample_rate, last timestamp) from a journal, e.g. after a crash."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, sample_rate = _HEADER.unpack_from(data)
+    if magic != JOURNAL_MAGIC:
+        raise ValueError(f"{path}: not a recorder journal")
+    store, last_t = EventStore(), 0.0
+    n_records = (len(data) - _HEADER.size) // _RECORD.size
+    for kind, idx, t, freq, wave, volume in _RECORD.iter_unpack(
+            data[_HEADER.size:_HEADER.size + n_records * _RECORD.size]):
+        last_t = max(last_t, t)
+        if kind == REC_ON and idx == len(store):
+            store.append(t, freq, wave, volume)
+        elif kind == REC_OFF and idx < len(store):
+            store.close(idx, t)
+    return store, sample_rate, last_t
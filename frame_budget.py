@@ -0,0 +1,61 @@
+from config import *
+
+# ---------------------- Adaptive frame budget ----------------------
+# Drawing is the only per-frame work that can be cut without touching the
+# sound, so when it runs over its share of the frame, visual quality steps
+# down one tier at a time: first the alpha-blended glows become flat fills,
+# then the breathing animation stops (lit keys are only repainted when they
+# change), then only every 2nd and finally every 4th loop iteration draws.
+# Input is still polled every iteration at FRAME_RATE. Quality steps back up
+# once the cost has stayed well under budget for a while; a tier that
+# overloads again right after being restored waits twice as long next time.
+TIERS = ('full', 'no-glow', 'static', 'half-rate', 'quarter-rate')
+DRAW_EVERY = (1, 1, 1, 2, 4)
+
+class FrameBudget:
+    def __init__(self, budget_ms=FRAME_BUDGET_MS, down_frames=FRAME_BUDGET_DOWN, up_frames=FRAME_BUDGET_UP):
+        self.budget = budget_ms / 1e3
+        self.down_frames = down_frames
+        self.base_up = self.up_frames = up_frames
+        self.tier = 0
+        self.cost = 0.0         # smoothed draw seconds per loop iteration (0 when the draw was skipped)
+        self.changes = 0
+        self._over = self._under = 0
+        self._frame = 0
+        self._since_up = None   # iterations since the last step up
+
+    @property
+    def name(self):
+        return TIERS[self.tier]
+
+    def should_draw(self):
+        """Call once per loop iteration; False on iterations the current tier skips."""
+        self._frame += 1
+        return self._frame % DRAW_EVERY[self.tier] == 0
+
+    def frame(self, draw_seconds):
+        """Feed one iteration's draw cost; returns the (possibly new) tier."""
+        self.cost += 0.1 * (draw_seconds - self.cost)
+        if self._since_up is not None:
+            self._since_up += 1
+        if self.cost > self.budget:
+            self._over, self._under = self._over + 1, 0
+        elif self.cost < 0.5 * self.budget:
+            self._over, self._under = 0, self._under + 1
+        else:
+            self._over = self._under = 0
+        if self._over >= self.down_frames and self.tier < len(TIERS) - 1:
+            # back down straight after a step up: that tier doesn't fit yet, so hold off longer
+            bounced = self._since_up is not None and self._since_up < 2 * self.up_frames
+            self.up_frames = min(16 * self.base_up, 2 * self.up_frames) if bounced else self.base_up
+            self._set(self.tier + 1)
+            self._since_up = None
+        elif self._under >= self.up_frames and self.tier > 0:
+            self._set(self.tier - 1)
+            self._since_up = 0
+        return self.tier
+
+    def _set(self, tier):
+        self.tier = tier
+        self.changes += 1
+        self._over = self._under = 0
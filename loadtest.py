@@ -0,0 +1,177 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")   # headless by default; real drivers if set
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+import pygame
+from config import *
+from main import PianoApp
+
+# ---------------------- Input replay & load generation ----------------------
+# Feeds KEYDOWN/KEYUP sequences through PianoApp.handle_event/end_frame, the
+# same code main() runs, either paced in real time or as fast as possible.
+# A script is a list of (t seconds, 'down'|'up', key) with key a character
+# ('z', '2', '[') or a pygame key name ('space', 'escape').
+LOWER = "zsxdcvgbhnjm"    # C..B, lower row
+UPPER = "q2w3er5t6y7u"    # C..B, upper row
+
+def _key(k):
+    return ord(k) if len(k) == 1 else pygame.key.key_code(k)
+
+def trill(secs=5.0, rate=24.0, a='c', b='v'):
+    """Two alternating keys, `rate` notes per second."""
+    out, t, i = [], 0.0, 0
+    while t < secs:
+        k = a if i % 2 == 0 else b
+        out += [(t, 'down', k), (t + 0.8 / rate, 'up', k)]
+        t += 1.0 / rate; i += 1
+    return out
+
+def chords(secs=5.0, rate=4.0):
+    """Ten-finger chords (both rows) struck `rate` times per second."""
+    keys = list("zcbmq") + list("wrtyu")
+    out, t = [], 0.0
+    while t < secs:
+        out += [(t, 'down', k) for k in keys] + [(t + 0.7 / rate, 'up', k) for k in keys]
+        t += 1.0 / rate
+    return out
+
+def sustain_under_load(secs=5.0, rate=16.0):
+    """Running scale while sustain is toggled on and off every half second."""
+    out, t, i = [], 0.0, 0
+    while t < secs:
+        k = (LOWER + UPPER)[i % 24]
+        out += [(t, 'down', k), (t + 0.5 / rate, 'up', k)]
+        t += 1.0 / rate; i += 1
+    for j in range(int(secs * 2)):
+        ts = j * 0.5
+        out += [(ts, 'down', 'space'), (ts + 0.01, 'up', 'space'),
+                (ts + 0.05, 'down', 'space'), (ts + 0.06, 'up', 'space')]
+    return sorted(out, key=lambda e: e[0])
+
+def octave_switching(secs=5.0):
+    """Held chord while the octave goes up and down underneath it."""
+    out, t, up = [], 0.0, True
+    while t < secs:
+        out += [(t, 'down', k) for k in "cbm"]
+        out += [(t + 0.1, 'down', ']' if up else '['), (t + 0.12, 'up', ']' if up else '[')]
+        out += [(t + 0.2, 'down', k) for k in "zx"]
+        out += [(t + 0.4, 'up', k) for k in "cbmzx"]
+        t += 0.5; up = not up
+    return out
+
+SCENARIOS = {'trill': trill, 'chords': chords, 'sustain': sustain_under_load, 'octave': octave_switching}
+
+def load_script(path):
+    with open(path) as f:
+        return [(float(t), kind, key) for t, kind, key in json.load(f)]
+
+def _spin(stop):
+    while not stop.is_set():
+        pass
+
+def cpu_load(n):
+    """Start n busy-looping processes; returns the Event that stops them."""
+    stop = multiprocessing.Event()
+    for _ in range(n):
+        multiprocessing.Process(target=_spin, args=(stop,), daemon=True).start()
+    return stop
+
+def run(script, realtime=False, record=False, load=0):
+    """Replay a script (with `load` CPU-hogging processes alongside); returns a stats dict."""
+    pygame.mixer.pre_init(SAMPLE_RATE, BITSIZE, CHANNELS, AUDIO_BUFFER)
+    pygame.init()
+    screen = pygame.display.set_mode((920, 440))
+    pygame.mixer.set_num_channels(64)
+    app = PianoApp(screen)
+    if record:
+        app.handle_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_TAB))
+
+    budget = 1.0 / FRAME_RATE
+    events = [(t, pygame.event.Event(pygame.KEYDOWN if kind == 'down' else pygame.KEYUP, key=_key(k)))
+              for t, kind, k in sorted(script, key=lambda e: e[0])]
+    end_t = (events[-1][0] if events else 0.0) + 0.5   # let release animations finish
+    stats = {'events': 0, 'frames': 0, 'overruns': 0, 'dropped': 0,
+             'peak_channels': 0, 'peak_mixer_busy': 0, 'peak_voices': 0, 'peak_tier': 0}
+    hog = cpu_load(load) if load else None
+    busy, i, vt = 0.0, 0, 0.0
+    t_start = last = time.perf_counter()
+    while vt < end_t:
+        now = time.perf_counter()
+        vt = now - t_start if realtime else stats['frames'] * budget
+        if realtime and now - last > 1.5 * budget:
+            stats['dropped'] += 1  # the previous frame made us miss a vsync-sized slot
+        last = now
+        t0 = time.perf_counter()
+        n = 0
+        while i < len(events) and events[i][0] <= vt:
+            app.handle_event(events[i][1]); i += 1; n += 1
+        app.end_frame(n > 0, False)
+        dt = time.perf_counter() - t0
+        busy += dt
+        stats['events'] += n
+        stats['frames'] += 1
+        stats['overruns'] += dt > budget
+        stats['peak_channels'] = max(stats['peak_channels'], len(app.active_channels))
+        if pygame.mixer.get_init():
+            mixer_busy = sum(pygame.mixer.Channel(c).get_busy() for c in range(pygame.mixer.get_num_channels()))
+            stats['peak_mixer_busy'] = max(stats['peak_mixer_busy'], mixer_busy)
+        if app.engine:
+            stats['peak_voices'] = max(stats['peak_voices'], app.engine.active_voices)
+        if app.budget:
+            stats['peak_tier'] = max(stats['peak_tier'], app.budget.tier)
+        if realtime:
+            time.sleep(max(0.0, budget - (time.perf_counter() - now)))
+
+    wall = time.perf_counter() - t_start
+    if hog:
+        hog.set()
+    if record:
+        with tempfile.TemporaryDirectory() as tmp:
+            app.recorder.take_name = os.path.join(tmp, "loadtest")
+            app.handle_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_TAB))
+            app.recorder.wait_exports()
+    stats.update(wall_s=wall, busy_s=busy, events_per_s=stats['events'] / max(busy, 1e-9),
+                 mean_frame_ms=1e3 * busy / max(1, stats['frames']),
+                 final_tier=app.budget.tier if app.budget else 0,
+                 tier_changes=app.budget.changes if app.budget else 0)
+    pygame.mixer.stop()
+    app.active_channels.clear(); app.held_keys.clear()
+    pygame.quit()
+    return stats
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay scripted or recorded key input through the live path.")
+    ap.add_argument("scenario", nargs="?", default="all", help=f"{', '.join(SCENARIOS)}, all, or a JSON script path")
+    ap.add_argument("--secs", type=float, default=5.0, help="length of built-in scenarios")
+    ap.add_argument("--realtime", action="store_true", help="pace frames at FRAME_RATE instead of max speed")
+    ap.add_argument("--record", action="store_true", help="also record (and render) the take")
+    ap.add_argument("--cpu-load", type=int, default=0, metavar="N", help="run N busy processes alongside")
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args(argv)
+
+    if args.scenario.endswith('.json'):
+        scripts = {os.path.basename(args.scenario): load_script(args.scenario)}
+    elif args.scenario == 'all':
+        scripts = {name: fn(args.secs) for name, fn in SCENARIOS.items()}
+    else:
+        scripts = {args.scenario: SCENARIOS[args.scenario](args.secs)}
+
+    results = {name: run(script, args.realtime, args.record, args.cpu_load) for name, script in scripts.items()}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    for name, s in results.items():
+        print(f"{name:<10} {s['events']:6d} events  {s['events_per_s']:9.0f} ev/s  {s['frames']:5d} frames  "
+              f"{s['mean_frame_ms']:6.2f} ms/frame  overruns {s['overruns']:4d}  dropped {s['dropped']:4d}  "
+              f"peak channels {s['peak_channels']} (mixer busy {s['peak_mixer_busy']}, voices {s['peak_voices']})  "
+              f"quality tier peak {s['peak_tier']} final {s['final_tier']} ({s['tier_changes']} changes)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,155 +1,451 @@
-import pygame
 import time
+T_LAUNCH = time.perf_counter()  # before the heavy imports, for startup metrics
+import sys
+import json
+import pygame
 from utils import *
 from config import *
 from piano_mapping import *
 from recording import Recorder
 from visualizer import Visualizer  # NEW
+from mixer import MixerEngine, NullSink, open_sink
+from audio_process import AudioProcess
+from scope import ScopeRing, SCOPE_VISIBLE
+from metrics import metrics
+from prewarm import Prewarmer
+from frame_budget import FrameBudget
+from scheduler import Scheduler, Metronome, Arpeggiator, LoopPlayer
 
-# ---------------------- Main ----------------------
-def main():
-    global sustain_on
-    pygame.mixer.pre_init(SAMPLE_RATE, BITSIZE, CHANNELS, AUDIO_BUFFER)
-    pygame.init()
-    # a bit wider & taller
-    screen = pygame.display.set_mode((920, 440))
-    pygame.display.set_caption("Keyboard Piano 🎹  [Space: sustain | [: octave- | ]: octave+ | 1/2/3: wave | +/-: volume | Tab: rec | Esc: panic]")
-    clock = pygame.time.Clock()
+# ---------------------- App ----------------------
+class PianoApp:
+    """All input handling and per-frame work, separate from the pygame loop so the
+    same code path can be driven by main() or by loadtest.py."""
+    def __init__(self, screen, launched_at=None):
+        self.launched_at = launched_at if launched_at is not None else time.perf_counter()
+        self.current_octave = BASE_OCTAVE
+        self.current_wave = WAVE_SINE
+        self.volume = DEFAULT_VOLUME
+        self.sustain_on = sustain_on
+        self.active_channels = active_channels
+        self.held_keys = held_keys
+        self.notes = {}             # key -> NoteSound whose loop keeps that key's channel sounding
 
-    current_octave = BASE_OCTAVE
-    current_wave = WAVE_SINE
-    volume = DEFAULT_VOLUME
-    pygame.mixer.set_num_channels(64)
+        self.engine = None
+        if AUDIO_ENGINE == 'mixer':
+            self.engine = MixerEngine()
+            self.engine.sink = open_sink(self.engine)
+        elif AUDIO_ENGINE == 'process':
+            self.engine = AudioProcess()
+
+        self.keymap = build_keymap(self.current_octave)
+        self.recorder = Recorder()
+        # timed playback (F5-F7) runs on the in-process engine's sample clock
+        self.sched = Scheduler(self.engine, self.recorder) if isinstance(self.engine, MixerEngine) else None
+        self.metronome = self.arp = self.looper = None
+        self.viz = Visualizer(screen, self.keymap)
+
+        self.monitor = None         # 'sound' engine: silent MixerEngine mirroring the keys, for the scope
+        self._monitor_seen, self._monitor_t = {}, 0.0
+        if SCOPE_ENABLED:
+            self.toggle_scope()
+
+        self.prewarm = None
+        if PREWARM and not self.engine:
+            self.prewarm = Prewarmer()
+            self.prewarm.start(self.current_octave, self.current_wave)
+        self.budget = FrameBudget() if FRAME_BUDGET else None
+        if self.budget:
+            metrics.gauge('quality_tier', self.budget.tier)
+        self.first_frame_at = self.first_sound_at = None
+        self.running = True
+        self.redraw = True
+        self.last_space_time = 0
+        self.space_tap_threshold = 0.2
+        self.status = ""
 
-    keymap = build_keymap(current_octave)
-    recorder = Recorder()
-    viz = Visualizer(screen, keymap)
+    def is_idle(self):
+        """Nothing sounding or animating (the loop may block on input)."""
+        return not (self.held_keys or self.active_channels or self.viz.active or self.recorder.exports
+                    or (self.prewarm and self.prewarm.busy) or (self.engine and self.engine.active_voices)
+                    or (self.sched and self.sched.sources))
 
-    running = True
-    last_space_time = 0
-    space_tap_threshold = 0.2
+    def progress(self):
+        """(label, 0..1) for the status line: a running export, else the prewarm."""
+        p = self.recorder.export_progress()
+        if p is not None:
+            return ("Export", p)
+        p = self.prewarm.progress() if self.prewarm else None
+        return ("Warming notes", p) if p is not None else None
 
-    status = ""
+    def draw_ui(self):
+        t0 = time.perf_counter()
+        with metrics.timer('update'):
+            self.viz.update()
+        with metrics.timer('draw'):
+            rects = self.viz.draw(self.current_octave, self.current_wave, self.volume, self.sustain_on,
+                                  self.recorder.is_recording, status_msg=self.status,
+                                  progress=self.progress())
+        with metrics.timer('flip'):
+            if rects:
+                pygame.display.update(rects)
+        if self.first_frame_at is None:
+            self.first_frame_at = time.perf_counter()
+            metrics.record('startup_window', self.first_frame_at - self.launched_at)
+        return time.perf_counter() - t0
 
-    def draw_ui():
-        viz.update()
-        viz.draw(current_octave, current_wave, volume, sustain_on, recorder.is_recording, status_msg=status)
-        pygame.display.flip()
+    def handle_event(self, event):
+        recorder, viz = self.recorder, self.viz
+        active_channels, held_keys = self.active_channels, self.held_keys
+        if event.type == pygame.QUIT:
+            if recorder.is_recording:
+                path = recorder.stop()
+                self.status = f"Saving: {path}" if path else "Nothing to save."
+            self.running = False
 
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+        elif event.type == pygame.KEYDOWN:
+            t_key = time.perf_counter()
+            key = event.key
+            if key == pygame.K_F3:
+                viz.show_metrics = not viz.show_metrics
+                self.redraw = True; return
+
+            if key == pygame.K_F4:
+                self.toggle_scope()
+                self.redraw = True; return
+
+            if key in (pygame.K_F5, pygame.K_F6, pygame.K_F7):
+                self.toggle_timed(key)
+                self.redraw = True; return
+
+            if key == pygame.K_ESCAPE:
+                pygame.mixer.stop()
+                self.stop_timed()
+                if self.engine:
+                    self.engine.panic()
+                active_channels.clear()
+                held_keys.clear()
                 if recorder.is_recording:
-                    path = recorder.stop()
-                    status = f"Saved: {path}" if path else "Nothing to save."
-                running = False
-
-            elif event.type == pygame.KEYDOWN:
-                key = event.key
-                if key == pygame.K_ESCAPE:
-                    pygame.mixer.stop()
-                    active_channels.clear()
-                    held_keys.clear()
-                    if recorder.is_recording:
-                        recorder.sustain_flush(list(recorder.active.keys()))
-                    status = "PANIC!"
-                    draw_ui()
-                    continue
-
-                if key == pygame.K_LEFTBRACKET:
-                    current_octave = max(MIN_OCTAVE, current_octave - 1)
-                    keymap = build_keymap(current_octave)
-                    viz.set_keymap(keymap)  # NEW
-                    status = "Octave -"
-                    draw_ui(); continue
-
-                if key == pygame.K_RIGHTBRACKET:
-                    current_octave = min(MAX_OCTAVE, current_octave + 1)
-                    keymap = build_keymap(current_octave)
-                    viz.set_keymap(keymap)  # NEW
-                    status = "Octave +"
-                    draw_ui(); continue
-
-                if key in (pygame.K_1, pygame.K_2, pygame.K_3):
-                    current_wave = {pygame.K_1:WAVE_SINE, pygame.K_2:WAVE_SQUARE, pygame.K_3:WAVE_SAW}[key]
-                    status = f"Wave: {['Sine','Square','Saw'][current_wave]}"
-                    draw_ui(); continue
-
-                if key in (pygame.K_PLUS, pygame.K_EQUALS):
-                    volume = min(1.0, volume + 0.05)
-                    status = f"Volume: {volume:.2f}"
-                    draw_ui(); continue
-
-                if key in (pygame.K_MINUS,):
-                    volume = max(0.05, volume - 0.05)
-                    status = f"Volume: {volume:.2f}"
-                    draw_ui(); continue
-
-                if key == pygame.K_SPACE:
-                    now = time.time()
-                    if now - last_space_time < space_tap_threshold:
-                        sustain_on = not sustain_on
-                        status = f"Sustain: {'ON' if sustain_on else 'OFF'}"
-                        if not sustain_on:
-                            keys_to_close = [k for k in list(active_channels.keys()) if k not in held_keys]
-                            recorder.sustain_flush([k for k in list(recorder.active.keys()) if k not in held_keys])
-                            viz.sustain_flush([k for k in list(viz.active.keys()) if k not in held_keys])  # NEW
-                            for k in keys_to_close:
-                                ch = active_channels.get(k)
-                                if ch:
-                                    ch.fadeout(int(ENV_RELEASE*1000))
-                                    active_channels.pop(k, None)
-                    last_space_time = now
-                    draw_ui(); continue
-
-                if key == pygame.K_TAB:
-                    if recorder.is_recording:
-                        path = recorder.stop(); status = f"Saved: {path}" if path else "Nothing to save."
-                    else:
-                        recorder.start(); status = "Recording..."
-                    draw_ui(); continue
-
-                if key in keymap:
-                    held_keys.add(key)
-                    name, octv = keymap[key]
-                    midi = note_name_to_midi(name, octv)
-                    freq = midi_to_freq(midi)
-                    snd = gen_waveform(current_wave, freq)
-                    ch = snd.play(loops=-1)
-                    if ch:
-                        ch.set_volume(volume); active_channels[key] = ch
-                    recorder.note_on(key, freq, current_wave, volume)
-                    viz.note_on(key, freq, current_wave, volume)  # NEW
-
-            elif event.type == pygame.KEYUP:
-                key = event.key
-                if key == pygame.K_SPACE:
-                    draw_ui(); continue
-                if key in held_keys:
-                    held_keys.discard(key)
-                    ch = active_channels.get(key)
+                    recorder.sustain_flush(list(recorder.active.keys()))
+                viz.sustain_flush(list(viz.active.keys()))  # let glows fade so the loop can go idle
+                self.status = "PANIC!"
+                self.redraw = True
+                return
+
+            if key == pygame.K_LEFTBRACKET:
+                self.current_octave = max(MIN_OCTAVE, self.current_octave - 1)
+                self.keymap = build_keymap(self.current_octave)
+                viz.set_keymap(self.keymap)  # NEW
+                self.status = "Octave -"
+                self._prioritize()
+                self.redraw = True; return
+
+            if key == pygame.K_RIGHTBRACKET:
+                self.current_octave = min(MAX_OCTAVE, self.current_octave + 1)
+                self.keymap = build_keymap(self.current_octave)
+                viz.set_keymap(self.keymap)  # NEW
+                self.status = "Octave +"
+                self._prioritize()
+                self.redraw = True; return
+
+            if key in (pygame.K_1, pygame.K_2, pygame.K_3):
+                self.current_wave = {pygame.K_1:WAVE_SINE, pygame.K_2:WAVE_SQUARE, pygame.K_3:WAVE_SAW}[key]
+                self.status = f"Wave: {['Sine','Square','Saw'][self.current_wave]}"
+                self._prioritize()
+                self.redraw = True; return
+
+            if key in (pygame.K_PLUS, pygame.K_EQUALS):
+                self.volume = min(1.0, self.volume + 0.05)
+                self.status = f"Volume: {self.volume:.2f}"
+                self.redraw = True; return
+
+            if key in (pygame.K_MINUS,):
+                self.volume = max(0.05, self.volume - 0.05)
+                self.status = f"Volume: {self.volume:.2f}"
+                self.redraw = True; return
+
+            if key == pygame.K_SPACE:
+                now = time.time()
+                if now - self.last_space_time < self.space_tap_threshold:
+                    self.sustain_on = not self.sustain_on
+                    self.status = f"Sustain: {'ON' if self.sustain_on else 'OFF'}"
+                    if not self.sustain_on:
+                        keys_to_close = [k for k in list(active_channels.keys()) if k not in held_keys]
+                        recorder.sustain_flush([k for k in list(recorder.active.keys()) if k not in held_keys])
+                        viz.sustain_flush([k for k in list(viz.active.keys()) if k not in held_keys])  # NEW
+                        if self.arp:
+                            for k in [k for k in self.arp.held if k not in held_keys]:
+                                self.arp.release(k)
+                        for k in keys_to_close:
+                            ch = active_channels.pop(k, None)
+                            if ch:
+                                self._release(k, ch)
+                self.last_space_time = now
+                self.redraw = True; return
+
+            if key == pygame.K_TAB:
+                if recorder.is_recording:
+                    path = recorder.stop(); self.status = f"Saving: {path}" if path else "Nothing to save."
+                else:
+                    recorder.start(); self.status = "Recording..."
+                self.redraw = True; return
+
+            if key in self.keymap:
+                held_keys.add(key)
+                name, octv = self.keymap[key]
+                midi = note_name_to_midi(name, octv)
+                freq = midi_to_freq(midi)
+                if self.arp:
+                    # the arpeggiator plays (and records) held keys on its own clock
+                    self.arp.hold(key, freq, self.current_wave, self.volume)
+                    viz.note_on(key, freq, self.current_wave, self.volume)
+                    return
+                if self.engine:
+                    ch = self.engine.note_on(key, freq, self.current_wave, self.volume)
+                else:
+                    old = active_channels.pop(key, None)
+                    if old:
+                        self._release(key, old)  # re-struck while sustained
+                    note = gen_waveform(self.current_wave, freq)
+                    ch = note.play()
+                    self.notes[key] = note
+                if ch:
+                    ch.set_volume(self.volume); active_channels[key] = ch
+                metrics.record('key_to_sound', time.perf_counter() - t_key)
+                recorder.note_on(key, freq, self.current_wave, self.volume)
+                viz.note_on(key, freq, self.current_wave, self.volume)  # NEW
+
+        elif event.type == pygame.KEYUP:
+            key = event.key
+            if key == pygame.K_SPACE:
+                self.redraw = True; return
+            if key in held_keys:
+                held_keys.discard(key)
+                ch = active_channels.get(key)
+                if ch and not self.sustain_on:
+                    active_channels.pop(key, None)
+                    self._release(key, ch)
+                if not self.sustain_on:
+                    recorder.note_off(key)
+                    viz.note_off(key)  # NEW
+                    if self.arp:
+                        self.arp.release(key)
+
+    def _release(self, key, ch):
+        """Release a live note: the engine voice's ADSR, or the NoteSound's fade into its tail."""
+        note = self.notes.get(key)
+        if note is not None and self.engine is None:
+            note.release(ch)
+        else:
+            ch.fadeout(int(ENV_RELEASE*1000))
+
+    def toggle_timed(self, key):
+        """F5 metronome, F6 arpeggiator over the held keys, F7 loop the last take."""
+        if self.sched is None:
+            self.status = "Timed playback needs AUDIO_ENGINE = 'mixer'"
+            return
+        sched = self.sched
+        if key == pygame.K_F5:
+            if self.metronome:
+                sched.remove(self.metronome); self.metronome = None
+            else:
+                self.metronome = sched.add(Metronome())
+            self.status = f"Metronome: {'ON' if self.metronome else 'OFF'}"
+        elif key == pygame.K_F6:
+            if self.arp:
+                sched.remove(self.arp); self.arp = None
+            else:
+                self.arp = sched.add(Arpeggiator())
+            self.status = f"Arpeggiator: {'ON' if self.arp else 'OFF'}"
+        elif self.looper:
+            sched.remove(self.looper); self.looper = None
+            self.status = "Loop: OFF"
+        elif self.recorder.is_recording or not len(self.recorder.events):
+            self.status = "Record a take to loop first."
+        else:
+            self.looper = sched.add(LoopPlayer(self.recorder.events.finalized()))
+            self.status = f"Loop: {self.looper.length:.1f}s"
+
+    def stop_timed(self):
+        if self.sched:
+            for src in list(self.sched.sources):
+                self.sched.remove(src)
+        self.metronome = self.arp = self.looper = None
+
+    def toggle_scope(self):
+        """F4: oscilloscope/spectrum panels on or off. Off detaches everything (no per-block cost)."""
+        if self.viz.scope is not None:
+            if isinstance(self.engine, AudioProcess):
+                self.engine.set_scope(False)
+            elif self.engine:
+                self.engine.scope = None
+            self.monitor = None
+            self.viz.set_scope(None)
+            return
+        if isinstance(self.engine, AudioProcess):
+            ring = self.engine.shared_scope  # the worker publishes every block into shared memory
+            self.engine.set_scope(True)
+        elif self.engine:
+            ring = self.engine.scope = ScopeRing()
+        else:
+            ring = ScopeRing()
+            # pygame.mixer output can't be tapped: render the same voices silently instead
+            self.monitor = MixerEngine(sink=NullSink())
+            self.monitor.scope = ring
+            self._monitor_seen, self._monitor_t = {}, time.perf_counter()
+        self.viz.set_scope(ring)
+
+    def _sync_monitor(self):
+        """Mirror the visualizer's notes into the monitor engine and render up to now."""
+        mon, seen, active = self.monitor, self._monitor_seen, self.viz.active
+        for k, ev in active.items():
+            if seen.get(k) is not ev:
+                seen[k] = ev
+                mon.note_on(k, ev["freq"], ev["wave"], ev["volume"])
+            if "release" in ev:
+                mon.note_off(k)
+        for k in [k for k in seen if k not in active]:
+            mon.note_off(k)
+            del seen[k]
+        now = time.perf_counter()
+        n = int((now - self._monitor_t) * mon.sample_rate) // mon.block_size
+        keep = -(-SCOPE_VISIBLE // mon.block_size)
+        if n > keep:  # reduced-rate drawing or a stall: only the newest blocks can ever be shown
+            self._monitor_t += (n - keep) * mon.block_size / mon.sample_rate
+            n = keep
+        for _ in range(n):
+            mon.process()
+        self._monitor_t += n * mon.block_size / mon.sample_rate
+
+    def _engine_fallback(self):
+        """The 'process' worker died or never opened its device: carry on with the in-process mixer."""
+        reason = self.engine.failed
+        scope_on = self.viz.scope is not None
+        if scope_on:
+            self.toggle_scope()   # detach the shared ring before it goes away
+        self.active_channels.clear()   # handles into the dead worker
+        self.engine.close()
+        self.engine = MixerEngine()
+        self.engine.sink = open_sink(self.engine)
+        self.sched = Scheduler(self.engine, self.recorder)
+        if scope_on:
+            self.toggle_scope()
+        self.status = f"{reason}: using the in-process mixer"
+        self.redraw = True
+
+    def _prioritize(self):
+        if self.prewarm and self.prewarm.busy:
+            self.prewarm.prioritize(self.current_octave, self.current_wave)
+
+    def end_frame(self, had_events, idle):
+        """Per-frame work after input: release stray channels, top up sustain loops,
+        feed the engine, draw."""
+        if self.sched:
+            self.sched.pump()  # first: it only has SCHED_LOOKAHEAD of slack
+        if not self.sustain_on:
+            for k in list(self.active_channels.keys()):
+                if k not in self.held_keys:
+                    ch = self.active_channels.pop(k, None)
                     if ch:
-                        if sustain_on:
-                            pass
-                        else:
-                            ch.fadeout(int(ENV_RELEASE*1000))
-                            active_channels.pop(key, None)
-                    if not sustain_on:
-                        recorder.note_off(key)
-                        viz.note_off(key)  # NEW
-
-        if not sustain_on:
-            for k in list(active_channels.keys()):
-                if k not in held_keys:
-                    ch = active_channels.get(k)
-                    if ch and not ch.get_queue():
-                        ch.fadeout(int(ENV_RELEASE*1000))
-                        active_channels.pop(k, None)
+                        self._release(k, ch)
                     # visual release will fade in viz.update()
+        for k, ch in self.active_channels.items():
+            note = self.notes.get(k)
+            if note and ch.get_queue() is None:  # most frames the loop is still queued
+                note.keep_alive(ch)
+
+        if self.prewarm and self.prewarm.busy:
+            self.prewarm.pump()
+            if self.prewarm.first_ready_at and self.first_sound_at is None:
+                # launch -> every key of the starting octave/wave plays without synthesis
+                self.first_sound_at = self.prewarm.first_ready_at
+                metrics.record('time_to_first_sound', self.first_sound_at - self.launched_at)
+        for path in self.recorder.poll_exports():
+            self.status = f"Saved: {path}" if path else "Export failed (journal kept)."
+            self.redraw = True
+        if self.engine:
+            self.engine.pump()
+            if isinstance(self.engine, AudioProcess) and self.engine.failed:
+                self._engine_fallback()
+            for dt in self.engine.drain_onsets():
+                metrics.record('onset', dt)  # key handled -> its first block rendered
+        if self.monitor is not None:
+            with metrics.timer('monitor'):
+                self._sync_monitor()
+        # control-key bursts only set `redraw`, so they cost one draw per frame
+        if self.redraw or had_events or not idle:
+            self._input_first()
+            if self.budget is None:
+                self.draw_ui()
+            else:
+                drawn = self.budget.should_draw()
+                cost = self.draw_ui() if drawn else 0.0
+                tier = self.budget.frame(cost)
+                if tier != self.viz.quality:
+                    self.viz.set_quality(tier)
+                    metrics.gauge('quality_tier', tier)
+                if not drawn:
+                    return  # keep `redraw` for the next frame that draws
+            self.redraw = False
+
+    def _input_first(self):
+        """Handle keys that arrived during this frame's work before spending time on the draw.
+
+        Everything pending is handled, in queue order: pulling only the key events
+        would run them ahead of a QUIT or focus change queued before them.
+        """
+        if pygame.event.peek((pygame.KEYDOWN, pygame.KEYUP)):
+            for event in pygame.event.get():
+                self.handle_event(event)
+
+    def startup_report(self):
+        return {name: metrics.stages[name].summary().get('mean_ms')
+                for name in ('startup_window', 'time_to_first_sound') if name in metrics.stages}
+
+    def shutdown(self):
+        if self.prewarm:
+            self.prewarm.stop()
+        self.recorder.wait_exports()  # let a take saved on quit finish writing
+        if self.engine:
+            self.viz.set_scope(None)
+            self.engine.close()
+        if metrics.enabled and METRICS_REPORT:
+            metrics.export(METRICS_REPORT)
+
+# ---------------------- Main ----------------------
+def main(argv=None):
+    # --startup-report: exit once prewarm is done and print the startup timings (ms)
+    startup_report = "--startup-report" in (sys.argv[1:] if argv is None else argv)
+    pygame.mixer.pre_init(SAMPLE_RATE, BITSIZE, CHANNELS, AUDIO_BUFFER)
+    pygame.init()
+    # a bit wider & taller
+    screen = pygame.display.set_mode((920, 440))
+    pygame.display.set_caption("Keyboard Piano 🎹  [Space: sustain | [: octave- | ]: octave+ | 1/2/3: wave | +/-: volume | Tab: rec | Esc: panic]")
+    clock = pygame.time.Clock()
+    pygame.mixer.set_num_channels(64)
 
-        draw_ui()
-        clock.tick(90)  # smoother animation with low latency
+    app = PianoApp(screen, launched_at=T_LAUNCH)
+    while app.running:
+        # Nothing sounding or animating: sleep in the event queue instead of polling.
+        # wait() returns as soon as an event arrives, so input latency is unchanged.
+        idle = app.is_idle()
+        if idle and not app.redraw:
+            first = pygame.event.wait(IDLE_WAIT_MS)
+            events = [first] + pygame.event.get() if first.type != pygame.NOEVENT else []
+        else:
+            events = pygame.event.get()
+        t_frame = time.perf_counter()
+        for event in events:
+            app.handle_event(event)
+        metrics.record('events', time.perf_counter() - t_frame)
+        app.end_frame(bool(events), idle)
+        metrics.record('frame', time.perf_counter() - t_frame)
+        if not idle:
+            clock.tick(FRAME_RATE)  # smoother animation with low latency
+        if startup_report and not (app.prewarm and app.prewarm.busy):
+            print(json.dumps(app.startup_report()))
+            app.running = False
 
+    app.shutdown()
     pygame.quit()
 
 if __name__ == "__main__":
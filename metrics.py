@@ -0,0 +1,121 @@
+import csv
+import json
+import time
+import threading
+import numpy as np
+from contextlib import contextmanager
+from config import *
+from frame_budget import TIERS
+
+# ---------------------- Instrumentation ----------------------
+# Per-stage perf_counter timers kept in fixed-size rolling windows (so
+# percentiles track recent behaviour and memory never grows), plus plain
+# counters and gauges (last value wins). One module-level `metrics` instance is shared by the app.
+# Counters are also bumped from prewarm threads (gen_waveform/note_buffer), so incr() takes a lock.
+class RollingStat:
+    def __init__(self, capacity=METRICS_WINDOW):
+        self.buf = np.zeros(capacity)
+        self.n = 0       # total samples ever added
+        self.max = 0.0
+
+    def add(self, value):
+        self.buf[self.n % len(self.buf)] = value
+        self.n += 1
+        self.max = max(self.max, value)
+
+    def values(self):
+        return self.buf[:min(self.n, len(self.buf))]
+
+    def summary(self):
+        v = self.values()
+        if not len(v):
+            return {'count': 0}
+        p50, p95, p99 = np.percentile(v, (50, 95, 99))
+        return {'count': self.n, 'mean_ms': 1e3 * float(v.mean()), 'p50_ms': 1e3 * p50,
+                'p95_ms': 1e3 * p95, 'p99_ms': 1e3 * p99, 'max_ms': 1e3 * self.max}
+
+class Metrics:
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        stat = self.stages.get(stage)
+        if stat is None:
+            stat = self.stages[stage] = RollingStat()
+        stat.add(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0)
+
+    def incr(self, counter, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def reset(self):
+        self.stages.clear()
+        with self._lock:
+            self.counters.clear()
+        self.gauges.clear()
+
+    def _counters(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def summary(self):
+        return {'stages': {k: s.summary() for k, s in self.stages.items()},
+                'counters': self._counters(), 'gauges': dict(self.gauges)}
+
+    def overlay_lines(self, stages=('key_to_sound', 'onset', 'events', 'draw', 'scope', 'monitor', 'flip', 'frame')):
+        """Short text lines for the visualizer overlay."""
+        lines = []
+        for name in stages:
+            s = self.stages.get(name)
+            if s is None or not s.n:
+                continue
+            m = s.summary()
+            lines.append(f"{name:<13} p50 {m['p50_ms']:6.2f}  p95 {m['p95_ms']:6.2f}  p99 {m['p99_ms']:6.2f} ms")
+        hits, misses = self.counters.get('sound_cache_hit', 0), self.counters.get('sound_cache_miss', 0)
+        if hits or misses:
+            evicted = self.counters.get('sound_cache_evict', 0)
+            lines.append(f"sound_cache   {hits} hit / {misses} miss / {evicted} evicted")
+        if 'quality_tier' in self.gauges:
+            tier = self.gauges['quality_tier']
+            lines.append(f"quality       tier {tier} ({TIERS[tier]})")
+        return lines
+
+    def export(self, path):
+        """Write the summary as JSON, or as one CSV row per stage/counter for .csv paths."""
+        summary = self.summary()
+        if path.lower().endswith('.csv'):
+            fields = ['name', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'value']
+            with open(path, 'w', newline='') as f:
+                w = csv.DictWriter(f, fieldnames=fields)
+                w.writeheader()
+                for name, row in summary['stages'].items():
+                    w.writerow({'name': name, **row})
+                for name, count in summary['counters'].items():
+                    w.writerow({'name': name, 'count': count})
+                for name, value in summary['gauges'].items():
+                    w.writerow({'name': name, 'value': value})
+        else:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2)
+        return path
+
+metrics = Metrics()
@@ -0,0 +1,361 @@
+import time
+import wave
+import threading
+import collections
+import numpy as np
+import pygame
+from config import *
+from utils import env_ramps
+from wavetable import bank
+
+# ---------------------- Real-time mixer engine ----------------------
+# All voices live in preallocated per-voice arrays and one block is rendered
+# for all of them at once: (voices x block) phase accumulator over the stacked
+# wavetables, a vectorized ADSR computed from each voice's age and release
+# point, then a sum over voices. Output goes to a pluggable sink, so the same
+# engine runs against the sound card, a WAV file or nothing at all.
+STEAL_OLDEST = 'oldest'
+STEAL_QUIETEST = 'quietest'
+
+class MixerEngine:
+    def __init__(self, sample_rate=SAMPLE_RATE, block_size=MIXER_BLOCK, max_voices=MAX_VOICES,
+                 steal=VOICE_STEAL, sink=None):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.max_voices = max_voices
+        self.steal = steal
+        self.sink = sink if sink is not None else NullSink()
+        self.lock = threading.Lock()  # note_on/off may race a callback-driven render
+
+        a, d, r = env_ramps(sample_rate, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE)
+        self.A, self.D, self.R = len(a), len(d), len(r)
+
+        n = max_voices
+        self.on = np.zeros(n, dtype=bool)
+        self.tid = np.zeros(n, dtype=np.intp)          # row in bank.stack
+        self.inc = np.zeros(n)                          # cycles per sample
+        self.phase = np.zeros(n)
+        self.age = np.zeros(n)                          # samples since note-on
+        self.rel_at = np.full(n, np.inf)                # age at note-off (inf while held)
+        self.rel_level = np.zeros(n)                    # envelope level when released
+        self.volume = np.zeros(n)
+        self.serial = np.zeros(n, dtype=np.int64)       # note-on order, for oldest-first stealing
+        self._next_serial = 0
+        self.keys = [None] * n
+        self.by_key = {}                                # key -> voice slot
+        self._j = np.arange(block_size, dtype=np.float64)
+        self.samples_rendered = 0
+        self.voices_stolen = 0
+        self.scope = None   # ScopeRing fed with every mixed block while set
+        # onset latency: note_on time -> start of the render of the block holding its first sample
+        self._onset_pending = []
+        self.onsets = collections.deque(maxlen=4096)
+        self.started = collections.deque(maxlen=4096)   # (key, sample of the voice's first output)
+
+    # ---------- Envelope ----------
+    def _ads(self, t):
+        """Attack/decay/sustain level at age t (samples); same ramps as utils.envelope()."""
+        A, D, s = self.A, self.D, ENV_SUSTAIN
+        att = np.maximum(t, 0.0) / max(1, A - 1)   # silent before a scheduled start (t < 0)
+        dec = 1.0 + (s - 1.0) * (t - A) / max(1, D - 1)
+        return np.where(t < A, att, np.where(t < A + D, dec, s))
+
+    def _level(self, slots):
+        t = self.age[slots]
+        rt = t - self.rel_at[slots]
+        rel = self.rel_level[slots] * np.clip(1.0 - rt / max(1, self.R - 1), 0.0, 1.0)
+        return np.where(rt >= 0, rel, self._ads(t))
+
+    # ---------- Voice control ----------
+    def _free_slot(self):
+        free = np.flatnonzero(~self.on)
+        if len(free):
+            return int(free[0])
+        self.voices_stolen += 1
+        slots = np.arange(self.max_voices)
+        sounding = self.age > 0   # not pending: scheduled ahead, or struck since the last block
+        if sounding.any():
+            slots = slots[sounding[slots]]
+        released = self.age[slots] >= self.rel_at[slots]   # in their release tail (scheduled notes know theirs early)
+        if released.any():
+            slots = slots[released]  # steal among released voices first
+        if self.steal == STEAL_QUIETEST:
+            level = self._level(slots)
+            attacking = (self.age[slots] < self.A) & (self.age[slots] < self.rel_at[slots])
+            level[attacking] = 1.0    # rank a note still ramping up by its peak, not its first samples
+            victim = slots[np.argmin(level * self.volume[slots])]
+        else:
+            victim = slots[np.argmin(self.serial[slots])]
+        self._kill(int(victim))
+        return int(victim)
+
+    def _kill(self, slot):
+        self.on[slot] = False
+        key = self.keys[slot]
+        if key is not None and self.by_key.get(key) == slot:
+            del self.by_key[key]
+        self.keys[slot] = None
+
+    def note_on(self, key, freq, wave, volume, sent_at=None):
+        """Start a voice; sent_at is the perf_counter() time the note was asked for (default: now)."""
+        with self.lock:
+            self._onset_pending.append(time.perf_counter() if sent_at is None else sent_at)
+            slot = self._start_voice(key, freq, wave, volume)
+        return VoiceHandle(self, key, slot)
+
+    def schedule(self, key, freq, wave, volume, start, end):
+        """Note from sample `start` to `end` of the engine clock (samples_rendered), placed
+        at that offset inside its block. A start that is already rendered plays from the
+        next block instead; returns the sample it will actually start at."""
+        with self.lock:
+            now = self.samples_rendered
+            begin = max(start, now)
+            slot = self._start_voice(key, freq, wave, volume)
+            self.age[slot] = now - begin            # negative: counts up to the first sample
+            self.phase[slot] = (self.inc[slot] * (now - begin)) % 1.0
+            held = float(max(1, end - begin))
+            self.rel_at[slot] = held                # release is already known
+            self.rel_level[slot] = self._ads(np.array([held]))[0]
+        return begin
+
+    def _start_voice(self, key, freq, wave, volume):
+        slot = self._free_slot()
+        self.on[slot] = True
+        self.tid[slot] = bank.table_id(wave, freq)
+        self.inc[slot] = freq / self.sample_rate
+        self.phase[slot] = 0.0
+        self.age[slot] = 0.0
+        self.rel_at[slot] = np.inf
+        self.volume[slot] = volume
+        self.serial[slot] = self._next_serial
+        self._next_serial += 1
+        old = self.by_key.get(key)
+        if old is not None:
+            self._release(old)  # retrigger: old voice keeps its release tail
+            self.keys[old] = None
+        self.keys[slot] = key
+        self.by_key[key] = slot
+        return slot
+
+    def _release(self, slot):
+        if self.on[slot] and not np.isfinite(self.rel_at[slot]):
+            self.rel_level[slot] = self._level(np.array([slot]))[0]
+            self.rel_at[slot] = self.age[slot]
+
+    def note_off(self, key):
+        with self.lock:
+            slot = self.by_key.get(key)
+            if slot is not None:
+                self._release(slot)
+
+    def set_volume(self, slot, volume):
+        self.volume[slot] = volume
+
+    def panic(self):
+        with self.lock:
+            self.on[:] = False
+            self.by_key.clear()
+            self.keys = [None] * self.max_voices
+
+    @property
+    def active_voices(self):
+        return int(np.count_nonzero(self.on))
+
+    def drain_onsets(self):
+        """Onset latencies (seconds) measured since the last call."""
+        out = []
+        while self.onsets:
+            out.append(self.onsets.popleft())
+        return out
+
+    def close(self):
+        close = getattr(self.sink, 'close', None)
+        if close:
+            close()
+
+    # ---------- Rendering ----------
+    def render_block(self):
+        """Mix every active voice into one float32 block and advance their state."""
+        with self.lock:
+            if self._onset_pending:
+                now = time.perf_counter()
+                self.onsets.extend(now - t for t in self._onset_pending)
+                self._onset_pending.clear()
+            slots = np.flatnonzero(self.on)
+            B = self.block_size
+            b0 = self.samples_rendered
+            self.samples_rendered += B
+            first = slots[(self.age[slots] <= 0) & (self.age[slots] > -B)]
+            for slot in first:
+                self.started.append((self.keys[slot], b0 - int(self.age[slot])))
+            if len(slots) == 0:
+                mix = np.zeros(B, dtype=np.float32)
+                if self.scope is not None:
+                    self.scope.write(mix)
+                return mix
+            j = self._j
+            pos = self.phase[slots, None] + self.inc[slots, None] * j
+            pos -= np.floor(pos)
+            pos *= bank.size
+            idx = pos.astype(np.intp)
+            frac = pos - idx
+            idx += (self.tid[slots] * (bank.size + 1))[:, None]
+            flat = bank.stack.ravel()
+            osc = flat[idx]
+            osc += (flat[idx + 1] - osc) * frac
+
+            t = self.age[slots, None] + j
+            rt = t - self.rel_at[slots, None]
+            env = np.where(rt >= 0,
+                           self.rel_level[slots, None] * np.clip(1.0 - rt / max(1, self.R - 1), 0.0, 1.0),
+                           self._ads(t))
+            env *= self.volume[slots, None]
+            mix = np.einsum('vb,vb->b', osc, env).astype(np.float32)
+
+            self.phase[slots] = (self.phase[slots] + self.inc[slots] * B) % 1.0
+            self.age[slots] += B
+            done = slots[self.age[slots] - self.rel_at[slots] >= self.R]
+            for slot in done:
+                self._kill(int(slot))
+            if self.scope is not None:
+                self.scope.write(mix)  # lock-free tap for the oscilloscope (see scope.py)
+            return mix
+
+    def process(self):
+        """Render one block into the sink."""
+        block = self.render_block()
+        self.sink.write(block)
+        return block
+
+    def pump(self):
+        """Feed push-style sinks until they have enough audio queued."""
+        while self.sink.wants_block():
+            self.process()
+
+class VoiceHandle:
+    """Channel-like handle returned by note_on, so callers can treat a voice like a pygame.Channel."""
+    def __init__(self, engine, key, slot):
+        self.engine, self.key, self.slot = engine, key, slot
+
+    def set_volume(self, volume):
+        if self.engine.keys[self.slot] == self.key:  # slot may have been stolen since
+            self.engine.set_volume(self.slot, volume)
+
+    def fadeout(self, ms=None):
+        self.engine.note_off(self.key)  # real ADSR release; length comes from ENV_RELEASE
+
+    def get_queue(self):
+        return None
+
+# ---------------------- Output sinks ----------------------
+def to_int16_stereo(block):
+    return np.repeat((np.clip(block, -1.0, 1.0) * 32767).astype(np.int16), 2).reshape(-1, 2)
+
+class NullSink:
+    """Discards audio; for headless tests and benchmarks."""
+    def __init__(self):
+        self.frames = 0
+
+    def wants_block(self):
+        return False
+
+    def write(self, block):
+        self.frames += len(block)
+
+class WavSink:
+    def __init__(self, path, sample_rate=SAMPLE_RATE):
+        self.wf = wave.open(path, 'wb')
+        self.wf.setnchannels(2)
+        self.wf.setsampwidth(2)
+        self.wf.setframerate(sample_rate)
+
+    def wants_block(self):
+        return False
+
+    def write(self, block):
+        self.wf.writeframes(to_int16_stereo(block).tobytes())
+
+    def close(self):
+        self.wf.close()
+
+class PygameQueueSink:
+    """Streams blocks through one reserved pygame.mixer channel using Channel.queue.
+
+    pygame has no public audio callback, so the main loop calls engine.pump()
+    every frame; chunk_blocks blocks are grouped per queued Sound so one
+    frame of lateness doesn't underrun.
+    """
+    def __init__(self, channel, chunk_blocks=4):
+        self.channel = channel
+        self.chunk_blocks = chunk_blocks
+        self._pending = []
+
+    def wants_block(self):
+        return bool(self._pending) or self.channel.get_queue() is None
+
+    def write(self, block):
+        self._pending.append(block)
+        if len(self._pending) < self.chunk_blocks:
+            return
+        snd = pygame.sndarray.make_sound(to_int16_stereo(np.concatenate(self._pending)))
+        self._pending = []
+        if self.channel.get_busy():
+            self.channel.queue(snd)
+        else:
+            self.channel.play(snd)
+
+class SDLCallbackSink:
+    """Pull-model sink: SDL's audio thread asks the engine for blocks as the device needs them.
+
+    Uses pygame._sdl2.audio (pygame 2); open_sink() falls back to
+    PygameQueueSink where it is unavailable.
+    """
+    def __init__(self, engine):
+        from pygame._sdl2.audio import AudioDevice, AUDIO_S16, get_audio_device_names
+        self.engine = engine
+        self._left = np.zeros(0, dtype=np.int16)
+        self._closing = False
+        names = get_audio_device_names(False)
+        if not names:
+            raise pygame.error("no audio output device")
+        self.device = AudioDevice(devicename=names[0], iscapture=False, frequency=engine.sample_rate,
+                                  audioformat=AUDIO_S16, numchannels=2, chunksize=engine.block_size,
+                                  allowed_changes=0, callback=self._callback)
+        self.device.pause(0)
+
+    def _callback(self, device, mem):
+        if self._closing:
+            mem[:] = bytes(len(mem))
+            return
+        need = len(mem) // 2
+        parts, have = [self._left], len(self._left)
+        while have < need:
+            block = to_int16_stereo(self.engine.render_block()).ravel()
+            parts.append(block); have += len(block)
+        out = np.concatenate(parts)
+        mem[:] = out[:need].tobytes()
+        self._left = out[need:]
+
+    def wants_block(self):
+        return False
+
+    def write(self, block):
+        pass
+
+    def close(self):
+        # SDL holds the device lock while the callback waits for the GIL, so closing
+        # mid-render can deadlock: silence the callback, let it drain, pause, then close.
+        self._closing = True
+        time.sleep(2 * self.engine.block_size / self.engine.sample_rate)
+        self.device.pause(1)
+        self.device.close()
+
+def open_sink(engine, kind=MIXER_SINK):
+    """Sound-card sink for the live app: SDL callback if possible, else a reserved mixer channel."""
+    if kind == 'callback':
+        try:
+            return SDLCallbackSink(engine)
+        except Exception:  # no pygame._sdl2, no device, or the device is busy
+            pass
+    pygame.mixer.set_reserved(1)
+    return PygameQueueSink(pygame.mixer.Channel(0))
@@ -0,0 +1,144 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import *
+from wavetable import TABLE_SIZE
+
+# ---------------------- Disk note cache ----------------------
+# Rendered stereo int16 note buffers live under NOTE_CACHE_DIR/<config hash>/ as
+# .npy files and are memory-mapped on load. The hash covers everything that
+# changes the rendered samples, so a config or synthesis change simply lands in
+# a fresh directory and the stale ones are pruned.
+
+def config_hash():
+    params = [SAMPLE_RATE, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE,
+              SYNTH_VERSION, TABLE_SIZE, NOTE_LOOP_SECONDS]
+    return hashlib.sha1(json.dumps(params).encode()).hexdigest()[:16]
+
+class DiskNoteCache:
+    def __init__(self, root=NOTE_CACHE_DIR):
+        self.root = root
+        self.dir = os.path.join(root, config_hash())
+        self._pruned = False
+
+    def _path(self, key):
+        wave_type, freq = key
+        return os.path.join(self.dir, f"w{wave_type}_{freq:.4f}.npy")
+
+    def load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None  # truncated/corrupt entry: caller re-renders and overwrites
+
+    def save(self, key, buf):
+        if not self._pruned:
+            self.prune_stale()
+        os.makedirs(self.dir, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # prewarm threads may race the UI
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(buf))
+        os.replace(tmp, path)  # atomic, so readers never see half-written files
+
+    def prune_stale(self):
+        """Remove cache directories written under a different config hash."""
+        self._pruned = True
+        if not os.path.isdir(self.root):
+            return
+        current = os.path.basename(self.dir)
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name != current and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+disk_cache = DiskNoteCache()
+
+# ---------------------- Memory note cache ----------------------
+class SoundLRU:
+    """Least-recently-used map with a byte budget: put(key, value, nbytes) evicts
+    the oldest entries until the total fits. Keeps hit/miss/eviction counts."""
+    def __init__(self, budget=SOUND_CACHE_BYTES):
+        self.budget = budget
+        self.entries = OrderedDict()   # key -> (value, nbytes)
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        """Insert and return how many entries were evicted to make room."""
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        evicted = 0
+        while self.nbytes > self.budget and len(self.entries) > 1:   # never evict what was just added
+            _, (_, n) = self.entries.popitem(last=False)
+            self.nbytes -= n
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.nbytes, 'budget': self.budget,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+def playable_notes():
+    """Every (wave, freq) reachable from the keymap across MIN_OCTAVE..MAX_OCTAVE."""
+    from piano_mapping import build_keymap
+    from utils import note_name_to_midi, midi_to_freq
+    midis = set()
+    for octv in range(MIN_OCTAVE, MAX_OCTAVE + 1):
+        for name, o in build_keymap(octv).values():
+            midis.add(note_name_to_midi(name, o))
+    return [(w, midi_to_freq(m)) for w in (WAVE_SINE, WAVE_SQUARE, WAVE_SAW) for m in sorted(midis)]
+
+def build_all():
+    from utils import note_buffer
+    notes = playable_notes()
+    for wave_type, freq in notes:
+        note_buffer(wave_type, freq)
+    return len(notes)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Manage the on-disk note buffer cache.")
+    ap.add_argument("--build", action="store_true", help="pre-render every playable note")
+    ap.add_argument("--clear", action="store_true", help="delete the whole cache first")
+    args = ap.parse_args()
+    if args.clear:
+        disk_cache.clear()
+        print(f"Cleared {disk_cache.root}")
+    if args.build:
+        n = build_all()
+        print(f"Cached {n} notes in {disk_cache.dir}")
+    if not (args.build or args.clear):
+        ap.print_help()
@@ -0,0 +1,93 @@
+import time
+import queue
+import threading
+from config import *
+from piano_mapping import build_keymap
+from utils import midi_to_freq, note_name_to_midi, note_buffer, note_layout, sound_key, sound_cache, NoteSound
+
+# ---------------------- Background prewarm ----------------------
+# Worker threads build the buffer of every note reachable from the keymap
+# across MIN_OCTAVE..MAX_OCTAVE and all waveforms (disk-cache load or synthesis,
+# both mostly numpy outside the GIL). The main thread turns finished buffers
+# into Sounds a few per frame in pump(), so no frame pays for more than that.
+# Notes of the current octave and waveform go first and are re-ranked when
+# either changes.
+WAVES = (WAVE_SINE, WAVE_SQUARE, WAVE_SAW)
+
+def _keymap_midis(octave):
+    return {note_name_to_midi(name, o) for name, o in build_keymap(octave).values()}
+
+class Prewarmer:
+    def __init__(self, workers=PREWARM_WORKERS, per_frame=PREWARM_PER_FRAME):
+        self.workers = workers
+        self.per_frame = per_frame
+        self.pending = []            # (wave, midi); built from the end
+        self.lock = threading.Lock()
+        self.ready = queue.SimpleQueue()
+        self.total = self.done = 0
+        self.first = set()           # current octave + wave at start(): "ready to play"
+        self.first_ready_at = None   # perf_counter() when all of `first` were installed
+        self.full = False            # sound cache budget reached; the rest stays on disk
+
+    def start(self, octave, wave):
+        midis = set()
+        for octv in range(MIN_OCTAVE, MAX_OCTAVE + 1):
+            midis |= _keymap_midis(octv)
+        self.pending = [(w, m) for w in WAVES for m in sorted(midis)]
+        self.total = len(self.pending)
+        self.first = {(wave, m) for m in _keymap_midis(octave)}
+        self.prioritize(octave, wave)
+        for i in range(max(1, self.workers)):
+            threading.Thread(target=self._work, name=f"prewarm-{i}", daemon=True).start()
+
+    def prioritize(self, octave, wave):
+        """Build the notes of this octave and waveform next."""
+        current = _keymap_midis(octave)
+        centre = sum(current) / len(current)
+        with self.lock:
+            self.pending.sort(key=lambda wm: (wm[1] not in current, wm[0] != wave, abs(wm[1] - centre)),
+                              reverse=True)
+
+    def stop(self):
+        with self.lock:
+            self.total -= len(self.pending)
+            self.pending.clear()
+
+    def _work(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    return
+                w, m = self.pending.pop()
+            freq = midi_to_freq(m)
+            try:
+                buf = note_buffer(w, freq)
+            except Exception:
+                buf = None  # gen_waveform will try again (and report) on first press
+            self.ready.put((w, m, freq, buf))
+
+    def pump(self):
+        """Main thread: install up to per_frame finished notes into the sound cache."""
+        for _ in range(self.per_frame):
+            try:
+                w, m, freq, buf = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            self.done += 1
+            key = sound_key(w, freq)
+            if buf is not None and not self.full and key not in sound_cache:
+                note = NoteSound(buf, note_layout(freq)[0])
+                if sound_cache.nbytes + note.nbytes > sound_cache.budget:
+                    self.full = True  # never evict to prewarm
+                else:
+                    sound_cache.put(key, note, note.nbytes)
+            self.first.discard((w, m))
+            if not self.first and self.first_ready_at is None:
+                self.first_ready_at = time.perf_counter()
+
+    @property
+    def busy(self):
+        return self.done < self.total
+
+    def progress(self):
+        return self.done / self.total if self.busy else None
@@ -1,92 +1,192 @@
 from config import *
+import os
 import time
+import json
+import datetime
+import functools
 import numpy as np
-import wave
-import datetime 
-from utils import synth_note
+from renderer import write_wav, render_blocks, IntervalIndex, IncrementalMix
+from event_store import EventStore, EventJournal
+from effects import build_chain
 
 # ---------------------- Recording ----------------------
 class Recorder:
-    def __init__(self, sample_rate=SAMPLE_RATE):
+    def __init__(self, sample_rate=SAMPLE_RATE, clock=time.perf_counter):
         self.sample_rate = sample_rate
+        self.clock = clock        # monotonic, high resolution: no drift/jumps on long takes
         self.is_recording = False
         self.start_time = None
-        self.events = []  # dicts with start, end, freq, wave, volume
-        self.active = {}  # key -> event
+        self.take_name = None
+        self.events = EventStore()  # start/end in seconds from start_time
+        self.active = {}  # key -> event index
+        self.journal = None
+        self.mix = None       # IncrementalMix of the take in progress
+        self.exports = []     # finished takes still being written by their worker
+        self._index = None    # (events.version, finalized events, IntervalIndex, open indices) for render_range()
+
+    def _now(self):
+        return self.clock() - self.start_time
 
     def start(self):
         self.is_recording = True
-        self.start_time = time.time()
+        self.start_time = self.clock()
+        self.take_name = "recording_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         self.events.clear()
         self.active.clear()
+        self.mix = IncrementalMix(self.sample_rate) if RENDER_IN_BACKGROUND else None
+        if USE_JOURNAL:
+            os.makedirs(JOURNAL_DIR, exist_ok=True)
+            self.journal = EventJournal(os.path.join(JOURNAL_DIR, self.take_name + ".kpj"), self.sample_rate)
 
     def stop(self):
+        """End the take and return the WAV path. With a background mix the file is
+        still being written when this returns: see poll_exports()/export_progress()."""
         if not self.is_recording:
             return None
-        now = time.time()
-        for ev in self.events:
-            if ev['end'] is None:
-                ev['end'] = now
+        now = self._now()
+        for idx in self.events.open_indices():
+            self._close(int(idx), now)
+        self.active.clear()
         self.is_recording = False
-        return self.render_to_wav()
+        journal, self.journal = self.journal, None
+        if journal:
+            journal.close()
+        mix, self.mix = self.mix, None
+        if mix is not None:
+            if not len(self.events):
+                mix.cancel()
+                self._drop_journal(journal)
+                return None
+            path = f"{self.take_name}.wav"
+            # the chain (IR load, FFTs) is built on the export thread, not here
+            mix.finish(path, RENDER_NORMALIZE, on_done=lambda _: self._drop_journal(journal),
+                       fx=functools.partial(build_chain, self.sample_rate))
+            self.exports.append(mix)
+            return path
+        path = self.render_to_wav()
+        if path:
+            self._drop_journal(journal)
+        return path
+
+    def _drop_journal(self, journal):
+        if journal and not KEEP_JOURNALS and os.path.exists(journal.path):
+            os.remove(journal.path)  # the WAV is safe; journal only matters after a crash
+
+    def poll_exports(self):
+        """Paths of background exports finished since the last call (None for a failed one)."""
+        done = [m for m in self.exports if m.done.is_set()]
+        self.exports = [m for m in self.exports if not m.done.is_set()]
+        return [m.path for m in done]
+
+    def export_progress(self):
+        """0..1 for the slowest running export, or None when nothing is being written."""
+        if not self.exports:
+            return None
+        return min(m.progress for m in self.exports)
+
+    def wait_exports(self, timeout=None):
+        for m in self.exports:
+            m.wait(timeout)
+        return self.poll_exports()
+
+    def _seal_point(self, now):
+        """Nothing can be added before the earliest still-open note (or now)."""
+        starts = self.events.array()['start']
+        return min([now] + [float(starts[i]) for i in self.active.values()])
+
+    def _close(self, idx, now):
+        if self.events.close(idx, now):
+            if self.journal:
+                self.journal.note_off(idx, now)
+            if self.mix is not None:
+                e = self.events.array()[idx]
+                self.mix.add(float(e['start']), float(e['end']), float(e['freq']), int(e['wave']),
+                             float(e['volume']), self._seal_point(now))
 
     def note_on(self, key, freq, wave, volume):
         if not self.is_recording:
             return
-        now = time.time()
-        ev = {'start': now, 'end': None, 'freq': float(freq),
-              'wave': int(wave), 'volume': float(volume)}
-        self.events.append(ev)
-        self.active[key] = ev
+        now = self._now()
+        prev = self.active.pop(key, None)
+        if prev is not None:
+            self._close(prev, now)  # re-struck while sustained: the old note ends here
+        idx = self.events.append(now, float(freq), int(wave), float(volume))
+        self.active[key] = idx
+        if self.journal:
+            self.journal.note_on(idx, now, float(freq), int(wave), float(volume))
 
     def note_off(self, key):
         if not self.is_recording:
             return
-        now = time.time()
-        ev = self.active.get(key)
-        if ev and ev['end'] is None:
-            ev['end'] = now
-        self.active.pop(key, None)
+        idx = self.active.pop(key, None)
+        if idx is not None:
+            self._close(idx, self._now())
+
+    def add_note(self, start, end, freq, wave, volume):
+        """A whole note whose start/end (seconds into the take) are already known, e.g. from
+        scheduler.Scheduler; it may lie a little in the future."""
+        if not self.is_recording:
+            return
+        idx = self.events.append(start, float(freq), int(wave), float(volume))
+        self.events.close(idx, end)
+        if self.journal:
+            self.journal.note_on(idx, start, float(freq), int(wave), float(volume))
+            self.journal.note_off(idx, end)
+        if self.mix is not None:
+            self.mix.add(start, end, float(freq), int(wave), float(volume),
+                         min(start, self._seal_point(self._now())))
 
     def sustain_flush(self, keys_to_close):
         if not self.is_recording:
             return
-        now = time.time()
+        now = self._now()
         for key in keys_to_close:
-            ev = self.active.get(key)
-            if ev and ev['end'] is None:
-                ev['end'] = now
-                self.active.pop(key, None)
+            idx = self.active.pop(key, None)
+            if idx is not None:
+                self._close(idx, now)
 
-    def render_to_wav(self):
-        if not self.events:
+    def save_events(self, filename):
+        """Write the take as a JSON event log (times relative to start) for render_cli.py."""
+        events = self.events.finalized()
+        rows = [{'start': float(e['start']), 'end': float(e['end']), 'freq': float(e['freq']),
+                 'wave': int(e['wave']), 'volume': float(e['volume'])} for e in events]
+        with open(filename, 'w') as f:
+            json.dump({'sample_rate': self.sample_rate, 'events': rows}, f)
+        return filename
+
+    def render_to_wav(self, filename=None, normalize=RENDER_NORMALIZE, workers=RENDER_WORKERS, fx=None):
+        """Render the take; fx defaults to the chain configured by the FX_* settings."""
+        if not len(self.events):
             return None
-        rel_events = []
-        for ev in self.events:
-            start = max(0.0, ev['start'] - self.start_time)
-            end = max(start + 0.001, ev['end'] - self.start_time if ev['end'] else start + 0.001)
-            rel_events.append({**ev, 'start': start, 'end': end})
-        total_duration = max(e['end'] + ENV_RELEASE for e in rel_events)
-        total_samples = int(self.sample_rate * total_duration) + 1
-        mix = np.zeros(total_samples, dtype=np.float32)
-        for ev in rel_events:
-            dur = max(0.001, (ev['end'] - ev['start']) + ENV_RELEASE)
-            note = synth_note(ev['wave'], ev['freq'], dur, ev['volume'])
-            start_idx = int(ev['start'] * self.sample_rate)
-            end_idx = start_idx + len(note)
-            if end_idx > len(mix):
-                mix = np.pad(mix, (0, end_idx - len(mix)), mode='constant')
-            mix[start_idx:end_idx] += note
-        peak = np.max(np.abs(mix)) if np.max(np.abs(mix)) > 0 else 1.0
-        if peak > 1.0:
-            mix = mix / peak
-        int16 = (mix * 32767).astype(np.int16)
-        stereo = np.column_stack((int16, int16))
-        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"recording_{ts}.wav"
-        with wave.open(filename, 'wb') as wf:
-            wf.setnchannels(2)
-            wf.setsampwidth(2)
-            wf.setframerate(self.sample_rate)
-            wf.writeframes(stereo.tobytes())
-        return filename
\ No newline at end of file
+        if filename is None:
+            filename = f"{self.take_name}.wav"
+        return write_wav(filename, self.events.finalized(), self.sample_rate,
+                         normalize=normalize, workers=workers,
+                         fx=build_chain(self.sample_rate) if fx is None else fx)
+
+    def render_range(self, t0, t1):
+        """Float32 preview of [t0, t1) seconds of the take (notes still held end now).
+
+        The finalized events and their IntervalIndex are cached until the take
+        changes, so repeated previews cost only the notes inside the window.
+        Held notes are indexed as 1 ms stubs; each query adds those starting
+        before t1 and ends them at the current time.
+        """
+        if self._index is None or self._index[0] != self.events.version:
+            events = self.events.finalized()
+            self._index = (self.events.version, events, IntervalIndex(events, self.sample_rate),
+                           self.events.open_indices())
+        _, events, index, open_ = self._index
+        sr = self.sample_rate
+        s0, s1 = int(t0 * sr), int(t1 * sr)
+        sel = index.query(s0, s1)
+        if len(open_) and self.is_recording:
+            held = open_[(events['start'][open_] * sr).astype(np.int64) < s1]
+            sel = np.union1d(sel, held)   # back in index order, which start-order ties follow
+            ev = events[sel]
+            is_open = np.isin(sel, held)
+            ev['end'][is_open] = np.maximum(ev['start'][is_open] + 0.001, self._now())
+        else:
+            ev = events[sel]
+        blocks = list(render_blocks(ev, sr, RENDER_BLOCK, s0, s1))
+        return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
@@ -0,0 +1,123 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # never touches display/mixer; keep stdout clean
+import csv
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config import *
+from renderer import events_to_array, write_wav, total_samples
+from event_store import replay_journal
+from effects import build_chain
+
+# ---------------------- Headless batch renderer ----------------------
+# Renders saved event logs to WAV without pygame.display or pygame.mixer.
+# A log is JSON (a list of events, or {"events": [...]}) or CSV with a header
+# row; each event has start, end, freq, wave, volume with times in seconds
+# from the start of the performance. wave is 0/1/2 or sine/square/saw.
+# Recorder journals (.kpj) left behind by a crashed session are replayed too.
+WAVE_NAMES = {'sine': WAVE_SINE, 'square': WAVE_SQUARE, 'saw': WAVE_SAW}
+
+def _parse_wave(w):
+    w = str(w).strip().lower()
+    return WAVE_NAMES[w] if w in WAVE_NAMES else int(w)
+
+def load_event_log(path):
+    if path.lower().endswith('.kpj'):
+        store, _, last_t = replay_journal(path)
+        return store.finalized(now=last_t)  # notes still held at the crash end there
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path) as f:
+            rows = json.load(f)
+        if isinstance(rows, dict):
+            rows = rows['events']
+    events = [{'start': float(r['start']),
+               'end': float(r['end']) if r.get('end') not in (None, '') else None,
+               'freq': float(r['freq']), 'wave': _parse_wave(r['wave']),
+               'volume': float(DEFAULT_VOLUME if r.get('volume') in (None, '') else r['volume'])} for r in rows]
+    return events_to_array(events)
+
+def render_file(src, dst, normalize=RENDER_NORMALIZE, workers=1, span=None, fx=None):
+    """Render one log (or just the (t0, t1) span of it); returns (src, dst, audio seconds, wall seconds).
+
+    fx is build_chain() keyword arguments; the chain is built here since effects keep state.
+    """
+    t0 = time.perf_counter()
+    events = load_event_log(src)
+    if len(events) == 0:
+        return src, None, 0.0, time.perf_counter() - t0
+    write_wav(dst, events, normalize=normalize, workers=workers, span=span, fx=build_chain(**(fx or {})))
+    audio = span[1] - span[0] if span else total_samples(events) / SAMPLE_RATE
+    return src, dst, audio, time.perf_counter() - t0
+
+def _output_path(src, out_dir):
+    stem = os.path.splitext(os.path.basename(src))[0]
+    return os.path.join(out_dir or os.path.dirname(src) or '.', stem + '.wav')
+
+def _output_paths(logs, out_dir):
+    """_output_path() per log; a name already taken in this batch (same stem from another
+    directory into -o, or take.json next to take.csv) gets the log's extension, then a number."""
+    taken, paths = set(), []
+    for src in logs:
+        dst = _output_path(src, out_dir)
+        base, ext = os.path.splitext(dst)
+        src_ext = os.path.splitext(src)[1].lstrip('.').lower()
+        candidates = [dst] + ([f"{base}_{src_ext}{ext}"] if src_ext else [])
+        n = 2
+        while all(os.path.abspath(c) in taken for c in candidates):
+            candidates.append(f"{base}_{n}{ext}"); n += 1
+        dst = next(c for c in candidates if os.path.abspath(c) not in taken)
+        taken.add(os.path.abspath(dst))
+        paths.append(dst)
+    return paths
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Render Keyboard Piano event logs (JSON/CSV/journal) to WAV, headless.")
+    ap.add_argument("logs", nargs="+", help="event log files (.json, .csv or .kpj journal)")
+    ap.add_argument("-o", "--out-dir", help="output directory (default: next to each log)")
+    ap.add_argument("-j", "--jobs", type=int, help="files rendered concurrently (default: cores / --workers)")
+    ap.add_argument("--workers", type=int, default=1, help="tile workers per file (see RENDER_WORKERS)")
+    ap.add_argument("--normalize", choices=("peak", "limit"), default=RENDER_NORMALIZE)
+    ap.add_argument("--range", nargs=2, type=float, metavar=("T0", "T1"),
+                    help="render only seconds [T0, T1) of each log (quick preview)")
+    ap.add_argument("--reverb", default=FX_REVERB_IR, metavar="IR",
+                    help="convolution reverb with this impulse response WAV ('room' = synthetic)")
+    ap.add_argument("--delay", type=float, default=FX_DELAY_SECONDS, metavar="SECONDS", help="feedback delay time")
+    ap.add_argument("--limit", action="store_true", default=FX_LIMIT, help="soft limiter after the effects")
+    args = ap.parse_args(argv)
+    fx = {'reverb_ir': args.reverb, 'delay': args.delay, 'limit': args.limit}
+    cores = os.cpu_count() or 1
+    if args.jobs is None:
+        # every job starts its own pool of --workers processes: keep the total near the core count
+        args.jobs = max(1, cores // (args.workers or cores))
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    jobs = list(zip(args.logs, _output_paths(args.logs, args.out_dir)))
+    failed, total_audio = 0, 0.0
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(max(1, min(args.jobs, len(jobs)))) as pool:
+        futures = {pool.submit(render_file, src, dst, args.normalize, args.workers, args.range, fx): src for src, dst in jobs}
+        for fut in as_completed(futures):
+            try:
+                src, dst, audio, wall = fut.result()
+            except Exception as e:  # one bad log must not sink the whole batch
+                failed += 1
+                print(f"FAILED {futures[fut]}: {e}", file=sys.stderr)
+                continue
+            if dst is None:
+                print(f"{src}: no events, skipped")
+                continue
+            total_audio += audio
+            print(f"{src} -> {dst}: {audio:.1f} s audio in {wall:.2f} s ({audio / max(wall, 1e-9):.1f}x realtime)")
+    wall = time.perf_counter() - t_start
+    print(f"{len(jobs) - failed}/{len(jobs)} files, {total_audio:.1f} s audio in {wall:.2f} s "
+          f"({total_audio / max(wall, 1e-9):.1f}x realtime)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
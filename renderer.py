@@ -0,0 +1,389 @@
+import os
+import wave
+import queue
+import tempfile
+import threading
+from itertools import islice
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config import *
+from utils import env_ramps
+from wavetable import bank
+from effects import soft_limit, apply_chain
+
+# ---------------------- Offline renderer ----------------------
+# Events are kept as a structured array with times relative to the session
+# start. The timeline is swept in fixed-size blocks; each block only mixes the
+# slices of notes that overlap it and is written out before the next one, so
+# peak memory is a few blocks regardless of session length. Voices are mixed
+# with slice-adds of a shared per-pitch oscillator stream times the cached
+# envelope ramps, so repeated notes never re-synthesize.
+EVENT_DTYPE = np.dtype([('start', 'f8'), ('end', 'f8'), ('freq', 'f8'),
+                        ('wave', 'i1'), ('volume', 'f8')])
+
+def events_to_array(events, t0=0.0):
+    """Recorder-style event dicts (absolute times, end may be None) -> EVENT_DTYPE array."""
+    arr = np.zeros(len(events), dtype=EVENT_DTYPE)
+    for i, ev in enumerate(events):
+        start = max(0.0, ev['start'] - t0)
+        end = max(start + 0.001, ev['end'] - t0 if ev['end'] else start + 0.001)
+        arr[i] = (start, end, ev['freq'], ev['wave'], ev['volume'])
+    return arr
+
+def note_spans(events, sample_rate=SAMPLE_RATE):
+    """Per-event (first sample, note length incl. release tail, note duration)."""
+    durs = np.maximum(0.001, (events['end'] - events['start']) + ENV_RELEASE)
+    starts = (events['start'] * sample_rate).astype(np.int64)
+    lengths = np.maximum(1, (sample_rate * durs).astype(np.int64))
+    return starts, lengths, durs
+
+def total_samples(events, sample_rate=SAMPLE_RATE):
+    if len(events) == 0:
+        return 0
+    starts, lengths, _ = note_spans(events, sample_rate)
+    tail = int(sample_rate * float(np.max(events['end'] + ENV_RELEASE))) + 1
+    return max(tail, int(np.max(starts + lengths)))
+
+class OscillatorCache:
+    """Oscillator streams per (wave, freq), rendered once and sliced by every note of that pitch.
+
+    Each note starts at phase 0, so sample j of any note is sample j of the
+    shared stream. Streams grow on demand up to max_samples; slices beyond
+    that (long sustained notes) are rendered directly.
+    """
+    def __init__(self, max_samples=int(OSC_CACHE_SECONDS * SAMPLE_RATE), max_streams=64):
+        self.max_samples = max_samples
+        self.max_streams = max_streams
+        self.streams = OrderedDict()
+
+    def get(self, wave_type, freq, start, count):
+        end = start + count
+        if end > self.max_samples:
+            return bank.render(wave_type, freq, count, start=start).astype(np.float32)
+        key = (wave_type, freq)
+        buf = self.streams.get(key)
+        have = 0 if buf is None else len(buf)
+        if have < end:
+            n = min(self.max_samples, max(end, 2 * have))
+            tail = bank.render(wave_type, freq, n - have, start=have).astype(np.float32)
+            buf = tail if buf is None else np.concatenate((buf, tail))
+            self.streams[key] = buf
+            if len(self.streams) > self.max_streams:
+                self.streams.popitem(last=False)
+        self.streams.move_to_end(key)
+        return buf[start:end]
+
+def _add_voice(out, osc_seg, n, o, vol, ramps):
+    """out += osc_seg * volume * envelope, for note samples [o, o+len(out)) of an n-sample note.
+
+    Same piecewise envelope as utils.envelope(), but each region is a direct
+    slice of a cached float32 ramp (or a scalar for the sustain plateau).
+    """
+    a_ramp, d_ramp, r_ramp = ramps
+    c = len(out)
+    A, D, R = len(a_ramp), len(d_ramp), len(r_ramp)
+    rel = n - R
+    regions = ((0, min(A, rel), a_ramp, 0),
+               (A, min(A + D, rel), d_ramp, A),
+               (A + D, rel, None, 0),
+               (max(0, rel), n, r_ramp, rel))
+    for lo, hi, ramp, base in regions:
+        x0, x1 = max(lo, o) - o, min(hi, o + c) - o
+        if x1 <= x0:
+            continue
+        if ramp is None:
+            out[x0:x1] += osc_seg[x0:x1] * np.float32(vol * ENV_SUSTAIN)
+        else:
+            out[x0:x1] += osc_seg[x0:x1] * ramp[x0+o-base:x1+o-base] * np.float32(vol)
+
+def render_blocks(events, sample_rate=SAMPLE_RATE, block_size=RENDER_BLOCK, start=0, stop=None):
+    """Yield the float32 mix of samples [start, stop) in blocks of block_size (last one may be short)."""
+    n_total = total_samples(events, sample_rate) if stop is None else stop
+    starts, lengths, _ = note_spans(events, sample_rate)
+    stops = (starts + lengths).tolist()
+    order = np.argsort(starts, kind='stable').tolist()
+    starts, lengths = starts.tolist(), lengths.tolist()
+    waves, freqs, vols = events['wave'].tolist(), events['freq'].tolist(), events['volume'].tolist()
+    ramps = tuple(r.astype(np.float32) for r in
+                  env_ramps(sample_rate, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE))
+    osc = OscillatorCache()
+    nxt, active = 0, []
+    for b0 in range(start, n_total, block_size):
+        b1 = min(b0 + block_size, n_total)
+        while nxt < len(order) and starts[order[nxt]] < b1:
+            active.append(order[nxt]); nxt += 1
+        active = [i for i in active if stops[i] > b0]
+        block = np.zeros(b1 - b0, dtype=np.float32)
+        for i in active:
+            s = starts[i]
+            lo, hi = max(b0, s), min(b1, stops[i])
+            if hi <= lo:
+                continue
+            o = lo - s
+            _add_voice(block[lo-b0:hi-b0], osc.get(waves[i], freqs[i], o, hi - lo),
+                       lengths[i], o, vols[i], ramps)
+        yield block
+
+# ---------------------- Interval index & partial renders ----------------------
+# Note spans sorted by first sample, plus the running max of their last
+# sample. Every note overlapping [s0, s1) starts before s1 and sits at or after
+# the first position whose running max passes s0, so a window query is two
+# binary searches and a scan of the candidates in between. One long note would
+# pin the running max and turn every later scan into O(N), so notes longer than
+# LONG_FACTOR x the median are kept out of it and tested one by one instead.
+class IntervalIndex:
+    LONG_FACTOR = 8
+
+    def __init__(self, events, sample_rate=SAMPLE_RATE):
+        starts, lengths, _ = note_spans(events, sample_rate)
+        self.order = np.argsort(starts, kind='stable')
+        self.starts = starts[self.order]
+        self.stops = (starts + lengths)[self.order]
+        lengths = lengths[self.order]
+        is_long = lengths > self.LONG_FACTOR * np.median(lengths) if len(lengths) else lengths > 0
+        self.long = np.flatnonzero(is_long)     # positions in start order
+        self.short = np.flatnonzero(~is_long)
+        self.short_starts = self.starts[self.short]
+        self.max_stop = np.maximum.accumulate(self.stops[self.short]) if len(self.short) else self.stops[:0]
+
+    def query(self, s0, s1):
+        """Event indices (in start order) of notes sounding anywhere in samples [s0, s1)."""
+        lo = int(np.searchsorted(self.max_stop, s0, side='right'))
+        hi = int(np.searchsorted(self.short_starts, s1, side='left'))
+        pos = self.short[lo:hi]
+        pos = pos[self.stops[pos] > s0]
+        if len(self.long):
+            lp = self.long
+            pos = np.sort(np.concatenate((pos, lp[(self.starts[lp] < s1) & (self.stops[lp] > s0)])))
+        return self.order[pos]
+
+def render_range_blocks(events, t0, t1, sample_rate=SAMPLE_RATE, block_size=RENDER_BLOCK, index=None):
+    """render_blocks() over [t0, t1) seconds only, touching just the notes that overlap it."""
+    if index is None:
+        index = IntervalIndex(events, sample_rate)
+    s0, s1 = int(t0 * sample_rate), int(t1 * sample_rate)
+    return render_blocks(events[index.query(s0, s1)], sample_rate, block_size, s0, s1)
+
+def render_range(events, t0, t1, sample_rate=SAMPLE_RATE, index=None):
+    """float32 mix of [t0, t1) seconds, sample-identical to that slice of the full render."""
+    blocks = list(render_range_blocks(events, t0, t1, sample_rate, index=index))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+# ---------------------- Parallel tiles ----------------------
+# Tiles are whole multiples of block_size, so every block is mixed exactly as
+# the serial sweep would mix it and the output is bit-identical. Notes that
+# straddle a tile edge (including release tails) are simply sliced by both
+# tiles, so tiles need no overlap and are concatenated, not summed. Each tile
+# is sent only the notes overlapping it (IntervalIndex.query, in start order),
+# so a tile costs its own notes, not the whole take.
+def _render_tile(args):
+    events, start, stop, sample_rate, block_size = args
+    blocks = list(render_blocks(events, sample_rate, block_size, start, stop))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+def render_tiles(events, sample_rate=SAMPLE_RATE, block_size=RENDER_BLOCK, workers=RENDER_WORKERS,
+                 tile_blocks=RENDER_TILE_BLOCKS):
+    """Like render_blocks(), but tiles of tile_blocks blocks are rendered in a process pool.
+
+    Tiles come back in timeline order with at most 2*workers in flight, so
+    memory stays bounded while the writer consumes them.
+    """
+    workers = workers or os.cpu_count() or 1
+    n_total = total_samples(events, sample_rate)
+    tile = block_size * tile_blocks
+    index = IntervalIndex(events, sample_rate)
+    tiles = ((events[index.query(t, min(t + tile, n_total))], t, min(t + tile, n_total), sample_rate, block_size)
+             for t in range(0, n_total, tile))
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque(pool.submit(_render_tile, t) for t in islice(tiles, 2 * workers))
+        while pending:
+            yield pending.popleft().result()
+            t = next(tiles, None)
+            if t is not None:
+                pending.append(pool.submit(_render_tile, t))
+
+def mix_blocks(events, sample_rate=SAMPLE_RATE, block_size=RENDER_BLOCK, workers=RENDER_WORKERS):
+    """Serial block sweep for workers == 1, process-pool tiles otherwise (0 = all cores)."""
+    if workers == 1:
+        return render_blocks(events, sample_rate, block_size)
+    return render_tiles(events, sample_rate, block_size, workers)
+
+def _write_block(wf, block):
+    int16 = (block * 32767).astype(np.int16)
+    wf.writeframes(np.repeat(int16, 2).tobytes())  # interleaved L/R
+
+def _write_normalized(wf, blocks, normalize, block_size, peak=None, on_block=None):
+    """Write float blocks to an open WAV as int16 stereo.
+
+    'limit' goes through soft_limit() in one pass. 'peak' rescales by the
+    peak if it is over 1.0; unless the caller already knows it (peak=...), the
+    blocks are spilled to a temp file while scanning for it, then re-read.
+    on_block(n) is called after each n samples written.
+    """
+    def write(block):
+        _write_block(wf, block)
+        if on_block:
+            on_block(len(block))
+    if normalize == 'limit':
+        for block in blocks:
+            write(soft_limit(block.copy()))
+        return
+    if peak is not None:
+        for block in blocks:
+            write(block / peak if peak > 1.0 else block)
+        return
+    with tempfile.TemporaryFile() as spill:
+        peak = 0.0
+        for block in blocks:
+            if len(block):
+                peak = max(peak, float(np.max(np.abs(block))))
+            spill.write(block.tobytes())
+        spill.seek(0)
+        for block in _read_spill(spill, block_size):
+            write(block / peak if peak > 1.0 else block)
+
+def _read_spill(f, block_size):
+    while True:
+        raw = f.read(block_size * 4)
+        if not raw:
+            return
+        yield np.frombuffer(raw, dtype=np.float32)
+
+def write_wav(filename, events, sample_rate=SAMPLE_RATE, block_size=RENDER_BLOCK, normalize=RENDER_NORMALIZE,
+              workers=RENDER_WORKERS, span=None, fx=None):
+    """Stream the rendered events into a 16-bit stereo WAV.
+
+    normalize='peak' spills float blocks to a temp file while scanning for the
+    peak, then rescales on a second pass over the file (no re-synthesis).
+    normalize='limit' writes in a single pass through soft_limit().
+    workers != 1 renders through render_tiles(); span=(t0, t1) renders just
+    that window through render_range_blocks(). fx is an effects chain
+    (effects.build_chain()) applied to the mix before normalizing.
+    """
+    if span is not None:
+        blocks = render_range_blocks(events, span[0], span[1], sample_rate, block_size)
+    else:
+        blocks = mix_blocks(events, sample_rate, block_size, workers)
+    with wave.open(filename, 'wb') as wf:
+        wf.setnchannels(2)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        _write_normalized(wf, apply_chain(blocks, fx), normalize, block_size)
+    return filename
+
+# ---------------------- Incremental (background) mix ----------------------
+# While recording, each note is mixed on a worker thread as soon as its end is
+# known. Blocks behind the seal point (no open or future note can reach them)
+# are spilled to a temp file as they complete, tracking the peak, so at the end
+# of a take only the last few notes and the normalize/convert pass remain, and
+# those run on the same worker. Output matches write_wav() to within rounding
+# (notes are summed in close order rather than start order).
+class IncrementalMix:
+    def __init__(self, sample_rate=SAMPLE_RATE, block_size=RENDER_BLOCK):
+        self.sample_rate, self.block_size = sample_rate, block_size
+        self.ramps = tuple(r.astype(np.float32) for r in
+                           env_ramps(sample_rate, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE))
+        self.osc = OscillatorCache()
+        self.blocks = {}      # block index -> float32 mix, not yet sealed
+        self.sealed = 0       # blocks [0, sealed) are in the spill file
+        self.n_total = 0      # samples needed so far, release tails included
+        self.peak = 0.0
+        self.spill = tempfile.TemporaryFile()
+        self.progress = 0.0   # 0..1 through the final export pass
+        self.path = None      # set once the WAV is complete
+        self.error = None
+        self.done = threading.Event()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="IncrementalMix", daemon=True)
+        self._thread.start()
+
+    # ---------- Producer side (recording thread) ----------
+    def add(self, start, end, freq, wave, volume, seal_at):
+        """Mix one closed note; nothing will be added before seal_at seconds from now on."""
+        self._queue.put(('note', (start, end, freq, wave, volume), seal_at))
+
+    def finish(self, filename, normalize=RENDER_NORMALIZE, on_done=None, fx=None):
+        """Write everything added so far (through the fx chain) to filename; on_done(filename) runs on the worker.
+
+        fx may also be a callable returning the chain, so building it (IR load, FFTs) happens on the worker too.
+        """
+        self._queue.put(('finish', filename, normalize, on_done, fx))
+
+    def cancel(self):
+        self._queue.put(('cancel',))
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    # ---------- Worker ----------
+    def _run(self):
+        try:
+            while True:
+                msg = self._queue.get()
+                if msg[0] == 'note':
+                    self._mix_note(*msg[1])
+                    self._seal(int(msg[2] * self.sample_rate) // self.block_size)
+                elif msg[0] == 'finish':
+                    self._finish(*msg[1:])
+                    return
+                else:
+                    return
+        except Exception as e:  # surfaced through .error; the take's journal is kept
+            self.error = e
+        finally:
+            self.spill.close()
+            self.done.set()
+
+    def _mix_note(self, start, end, freq, wave, volume):
+        # same span arithmetic as EventStore.finalized() + note_spans()/total_samples()
+        sr, B = self.sample_rate, self.block_size
+        start = max(0.0, start)
+        end = max(start + 0.001, end)
+        s = int(start * sr)
+        n = max(1, int(sr * max(0.001, (end - start) + ENV_RELEASE)))
+        self.n_total = max(self.n_total, int(sr * (end + ENV_RELEASE)) + 1, s + n)
+        for b in range(max(s // B, self.sealed), (s + n - 1) // B + 1):
+            block = self.blocks.get(b)
+            if block is None:
+                block = self.blocks[b] = np.zeros(B, dtype=np.float32)
+            b0 = b * B
+            lo, hi = max(b0, s), min(b0 + B, s + n)
+            o = lo - s
+            _add_voice(block[lo-b0:hi-b0], self.osc.get(wave, freq, o, hi - lo), n, o, volume, self.ramps)
+
+    def _seal(self, upto, n_total=None):
+        """Spill blocks [sealed, upto) in order; the last one is cut to n_total samples."""
+        while self.sealed < upto:
+            block = self.blocks.pop(self.sealed, None)
+            if block is None:
+                block = np.zeros(self.block_size, dtype=np.float32)
+            if n_total is not None:
+                block = block[:n_total - self.sealed * self.block_size]
+            if len(block):
+                self.peak = max(self.peak, float(np.max(np.abs(block))))
+            self.spill.write(block.tobytes())
+            self.sealed += 1
+
+    def _finish(self, filename, normalize, on_done, fx):
+        B = self.block_size
+        if callable(fx):
+            fx = fx()
+        self._seal(-(-self.n_total // B), self.n_total)
+        self.spill.seek(0)
+        written = 0
+        def advance(n):
+            nonlocal written
+            written += n
+            self.progress = min(1.0, written / max(1, self.n_total))
+        with wave.open(filename, 'wb') as wf:
+            wf.setnchannels(2)
+            wf.setsampwidth(2)
+            wf.setframerate(self.sample_rate)
+            blocks = apply_chain(_read_spill(self.spill, B), fx)
+            # the dry peak is already known; effects change it, so then it is re-scanned
+            _write_normalized(wf, blocks, normalize, B, peak=None if fx else self.peak, on_block=advance)
+        self.progress = 1.0
+        self.path = filename
+        if on_done:
+            on_done(filename)
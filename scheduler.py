@@ -0,0 +1,177 @@
+import time
+import itertools
+import numpy as np
+from config import *
+
+# ---------------------- Lookahead scheduler ----------------------
+# Timed playback (metronome, arpeggiator, loops) runs on a sample clock, not
+# on frames. Each pump() (once per frame is plenty) asks every source for the
+# notes that start before now + SCHED_LOOKAHEAD and hands them over as whole
+# notes with exact start/end samples: MixerEngine.schedule() places each one
+# at its offset inside its block, and Recorder.add_note() stores the same
+# times, so frame jitter never reaches the audio or the take. Only a frame
+# that is late by more than the lookahead makes notes late: those still play,
+# from the next block (counted in .late), unless they were due more than a
+# lookahead ago; those are skipped rather than piled up at once (.dropped).
+class Scheduler:
+    def __init__(self, engine=None, recorder=None, lookahead=SCHED_LOOKAHEAD, sample_rate=SAMPLE_RATE):
+        self.engine, self.recorder = engine, recorder
+        self.sample_rate = engine.sample_rate if engine is not None else sample_rate
+        self.lookahead = int(lookahead * self.sample_rate)
+        self.sources = []
+        self.filled = None      # every note starting before this sample has been handed over
+        self.late = 0
+        self.dropped = 0
+        self._keys = itertools.count()
+        self._t0 = time.perf_counter()
+        self._take = None       # (recorder.start_time, take seconds - engine seconds): maps samples into the take
+
+    def now(self):
+        """Current sample: the engine's render position, or wall time without an engine."""
+        if self.engine is not None:
+            return self.engine.samples_rendered
+        return int((time.perf_counter() - self._t0) * self.sample_rate)
+
+    def add(self, source):
+        """Start a source with its beat 0 at the next sample not yet handed over."""
+        now = self.now()
+        source.start(max(now, self.filled or now), self.sample_rate)
+        self.sources.append(source)
+        return source
+
+    def remove(self, source):
+        """Stop a source; notes already handed over still play out."""
+        if source in self.sources:
+            self.sources.remove(source)
+
+    def pump(self):
+        """Hand over every note starting before now + lookahead; returns their (key, start sample)."""
+        now = self.now()
+        if self.filled is None:
+            self.filled = now
+        oldest = now - self.lookahead
+        if self.filled < oldest:   # stalled for longer than the lookahead
+            for src in self.sources:
+                self.dropped += sum(1 for _ in src.notes(self.filled, oldest))
+            self.filled = oldest
+        self._anchor(now)
+        horizon = now + self.lookahead
+        out = []
+        if horizon > self.filled:
+            for src in self.sources:
+                for start, end, freq, wave, volume in src.notes(self.filled, horizon):
+                    out.append(self._dispatch(src, now, start, end, freq, wave, volume))
+            self.filled = horizon
+        return out
+
+    def _anchor(self, now):
+        """Track take time minus engine time, so recorded notes sit on the same clock as live ones.
+
+        The engine clock only moves when a block renders, so the smallest offset seen
+        (a pump right after a render) is the true one; it may creep up by a few µs per
+        pump so that drift between the device clock and perf_counter is followed too.
+        """
+        rec = self.recorder
+        if rec is None or not rec.is_recording:
+            self._take = None
+            return
+        offset = (rec.clock() - rec.start_time) - now / self.sample_rate
+        if self._take is not None and self._take[0] == rec.start_time:
+            offset = min(offset, self._take[1] + 1e-5)
+        self._take = (rec.start_time, offset)
+
+    def _dispatch(self, src, now, start, end, freq, wave, volume):
+        key = ('sched', next(self._keys))
+        if self.engine is not None:
+            if self.engine.schedule(key, freq, wave, volume, start, end) > start:
+                self.late += 1
+        elif start < now:
+            self.late += 1
+        if src.record and self._take is not None:
+            offset, sr = self._take[1], self.sample_rate
+            self.recorder.add_note(offset + start / sr, offset + end / sr, freq, wave, volume)
+        return key, start
+
+# ---------------------- Sources ----------------------
+# A source yields (start, end, freq, wave, volume) for the notes starting in
+# [s0, s1), in samples on the scheduler's clock; start() fixes its origin.
+class Source:
+    record = True   # also goes into the take while recording
+
+    def start(self, origin, sample_rate):
+        self.origin, self.sample_rate = origin, sample_rate
+
+    def _grid(self, step, s0, s1):
+        """(k, sample) for every grid point origin + k*step in [s0, s1); step in samples."""
+        k = max(0, int((s0 - self.origin) // step))
+        while True:
+            pos = self.origin + int(round(k * step))
+            if pos >= s1:
+                return
+            if pos >= s0:
+                yield k, pos
+            k += 1
+
+class Metronome(Source):
+    """A click every beat, an octave up on the first beat of each bar."""
+    record = False
+
+    def __init__(self, bpm=SCHED_BPM, beats=4, freq=1760.0, volume=0.4, click=0.02):
+        self.bpm, self.beats, self.freq, self.volume, self.click = bpm, beats, freq, volume, click
+
+    def notes(self, s0, s1):
+        n = max(1, int(self.click * self.sample_rate))
+        for k, pos in self._grid(60.0 / self.bpm * self.sample_rate, s0, s1):
+            freq = self.freq * (2 if k % self.beats == 0 else 1)
+            yield pos, pos + n, freq, WAVE_SINE, self.volume
+
+class Arpeggiator(Source):
+    """Steps through the held notes, low to high ('up'), high to low ('down') or both ('updown')."""
+    def __init__(self, rate=SCHED_ARP_RATE, pattern='up', gate=SCHED_ARP_GATE):
+        self.rate, self.pattern, self.gate = rate, pattern, gate
+        self.held = {}   # key -> (freq, wave, volume)
+
+    def hold(self, key, freq, wave, volume):
+        self.held[key] = (freq, wave, volume)
+
+    def release(self, key):
+        self.held.pop(key, None)
+
+    def notes(self, s0, s1):
+        step = self.sample_rate / self.rate
+        n = max(1, int(step * self.gate))
+        for k, pos in self._grid(step, s0, s1):
+            if not self.held:
+                continue
+            seq = sorted(self.held.values())
+            if self.pattern == 'down':
+                seq = seq[::-1]
+            elif self.pattern == 'updown' and len(seq) > 2:
+                seq = seq + seq[-2:0:-1]
+            freq, wave, volume = seq[k % len(seq)]
+            yield pos, pos + n, freq, wave, volume
+
+class LoopPlayer(Source):
+    """Plays a take (EVENT_DTYPE, seconds) over and over; a pass lasts `length` s (default: to its last note-off)."""
+    record = False
+
+    def __init__(self, events, length=None):
+        self.events = np.sort(events, order='start')
+        self.length = length if length is not None else float(self.events['end'].max())
+
+    def start(self, origin, sample_rate):
+        super().start(origin, sample_rate)
+        self.starts = np.round(self.events['start'] * sample_rate).astype(np.int64)
+        self.ends = np.maximum(self.starts + 1, np.round(self.events['end'] * sample_rate).astype(np.int64))
+        self.period = max(1, int(round(self.length * sample_rate)))
+
+    def notes(self, s0, s1):
+        ev, L = self.events, self.period
+        first = max(0, (s0 - self.origin) // L)
+        last = (s1 - 1 - self.origin) // L
+        for i in range(first, last + 1):
+            base = self.origin + i * L
+            lo, hi = np.searchsorted(self.starts, (s0 - base, s1 - base))
+            for j in range(lo, hi):
+                yield (base + int(self.starts[j]), base + int(self.ends[j]), float(ev['freq'][j]),
+                       int(ev['wave'][j]), float(ev['volume'][j]))
@@ -0,0 +1,166 @@
+import numpy as np
+import pygame
+from config import *
+
+# ---------------------- Oscilloscope & spectrum ----------------------
+# The audio side writes every mixed block into a ScopeRing (one writer, no
+# lock: it copies the samples, then bumps a counter). The UI side reads the
+# newest samples into preallocated arrays, so drawing a frame does no array
+# allocation: the scope is min/max-decimated to one column per pixel, the
+# spectrum is a fixed Hann window + rfft into a reused output, both turned
+# into pixel masks and blitted with surfarray. A torn read (the writer
+# lapping the reader mid-copy) only ever garbles one frame of the display.
+
+# rfft(out=) is numpy >= 2.0; older numpy gets the result copied into the same array
+_RFFT_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+SCOPE_VISIBLE = max(2 * SCOPE_SAMPLES, SCOPE_FFT)   # newest samples the panels read per draw
+
+class ScopeRing:
+    """Power-of-two float32 ring of the newest mixed samples.
+
+    With `buffer` (e.g. a SharedMemory.buf of nbytes(size)) the counter and
+    samples live there, so the writer can be another process.
+    """
+    def __init__(self, size=SCOPE_RING, buffer=None):
+        assert size & (size - 1) == 0, "ring size must be a power of two"
+        if buffer is None:
+            buffer = bytearray(self.nbytes(size))
+        self._count = np.ndarray(1, dtype=np.uint64, buffer=buffer)
+        self.buf = np.ndarray(size, dtype=np.float32, buffer=buffer, offset=8)
+        self.mask = size - 1
+
+    @staticmethod
+    def nbytes(size=SCOPE_RING):
+        return 8 + 4 * size
+
+    @property
+    def written(self):
+        """Total samples ever written; only the writer changes it."""
+        return int(self._count[0])
+
+    @written.setter
+    def written(self, n):
+        self._count[0] = n
+
+    def write(self, block):
+        size = len(self.buf)
+        if len(block) > size:
+            self.written += len(block) - size
+            block = block[-size:]
+        n = len(block)
+        i = self.written & self.mask
+        first = min(n, size - i)
+        self.buf[i:i + first] = block[:first]
+        self.buf[:n - first] = block[first:]
+        self.written += n
+
+    def latest(self, out):
+        """Copy the newest len(out) samples into out, oldest first."""
+        n = len(out)
+        end = self.written & self.mask
+        if end >= n:
+            out[:] = self.buf[end - n:end]
+        else:
+            out[:n - end] = self.buf[len(self.buf) - (n - end):]
+            out[n - end:] = self.buf[:end]
+        return out
+
+class ScopeView:
+    """Oscilloscope (left of the keyboard card) and log-frequency spectrum (right of it)."""
+    def __init__(self, ring, scope_rect, spec_rect, sample_rate=SAMPLE_RATE):
+        self.ring = ring
+        self.scope_rect, self.spec_rect = scope_rect, spec_rect
+        n, N = SCOPE_SAMPLES, SCOPE_FFT
+        self.raw = np.zeros(2 * n, dtype=np.float32)   # two windows, so a trigger point can be found
+        self.rising = np.zeros(n, dtype=bool)
+        self.below = np.zeros(n, dtype=bool)
+        self.frame = np.zeros(N)
+        self.window = np.hanning(N)                    # fixed analysis window
+        self.spec = np.zeros(N // 2 + 1, dtype=np.complex128)
+        self.mag = np.zeros(N // 2 + 1)
+        self.ref = np.sum(self.window) / 2             # full-scale sine -> 0 dB
+        self.scope = _Panel(scope_rect.size, (90, 180, 255))
+        self.spectrum = _Panel(spec_rect.size, (180, 255, 120))
+
+        w = scope_rect.width
+        self.scope_starts = (np.arange(w) * n) // w    # min/max reduceat segments, one per column
+        ws = spec_rect.width
+        # log-spaced frequency columns from 40 Hz to Nyquist, as rfft bin ranges
+        edges = np.geomspace(40.0, sample_rate / 2, ws + 1) * N / sample_rate
+        self.spec_starts = np.minimum(edges[:-1].astype(np.intp), N // 2)
+
+    def draw(self, surf):
+        """Render both panels onto surf; returns their rects for display.update()."""
+        n = SCOPE_SAMPLES
+        raw = self.ring.latest(self.raw)
+        # trigger on the first rising zero crossing in the older half, so the trace stands still
+        np.less(raw[:n], 0.0, out=self.below)
+        np.greater_equal(raw[1:n + 1], 0.0, out=self.rising)
+        np.logical_and(self.below, self.rising, out=self.rising)
+        t = int(self.rising.argmax()) + 1 if self.rising.any() else n
+        seg = raw[t:t + n]
+        p = self.scope
+        np.minimum.reduceat(seg, self.scope_starts, out=p.lo)
+        np.maximum.reduceat(seg, self.scope_starts, out=p.hi)
+        p.draw_span(surf, self.scope_rect)
+
+        np.multiply(self.ring.latest(self.frame), self.window, out=self.frame)
+        if _RFFT_OUT:
+            np.fft.rfft(self.frame, out=self.spec)
+        else:
+            self.spec[:] = np.fft.rfft(self.frame)
+        np.abs(self.spec, out=self.mag)
+        q = self.spectrum
+        np.maximum.reduceat(self.mag, self.spec_starts, out=q.hi)
+        # dB below full scale -> 0..1 bar height
+        np.multiply(q.hi, 1.0 / self.ref, out=q.hi)
+        np.maximum(q.hi, 1e-9, out=q.hi)
+        np.log10(q.hi, out=q.hi)
+        np.multiply(q.hi, 20.0 / SCOPE_DB_RANGE, out=q.hi)
+        np.add(q.hi, 1.0, out=q.hi)
+        np.clip(q.hi, 0.0, 1.0, out=q.hi)
+        q.draw_bars(surf, self.spec_rect)
+        return [self.scope_rect, self.spec_rect]
+
+class _Panel:
+    """Preallocated pixel buffer for one panel: column values -> row mask -> blit_array."""
+    def __init__(self, size, color):
+        w, h = size
+        self.surface = pygame.Surface(size)
+        self.bg, self.fg = self.surface.map_rgb((20, 20, 20)), self.surface.map_rgb(color)
+        self.mid = self.surface.map_rgb((44, 44, 44))
+        self.pixels = np.zeros((w, h), dtype=np.uint32)
+        self.rows = np.arange(h, dtype=np.float32)[None, :]
+        self.lo = np.zeros(w, dtype=np.float32)
+        self.hi = np.zeros(w, dtype=np.float32)
+        self.a = np.zeros((w, h), dtype=bool)
+        self.b = np.zeros((w, h), dtype=bool)
+
+    def _blit(self, surf, rect):
+        pygame.surfarray.blit_array(self.surface, self.pixels)
+        surf.blit(self.surface, rect)
+
+    def draw_span(self, surf, rect):
+        """Trace: light every row between each column's min and max sample."""
+        h = self.pixels.shape[1]
+        s = 0.5 * (h - 1)
+        # samples -> rows (up is positive); hi sample is the upper (smaller) row
+        np.multiply(self.hi, -s, out=self.hi); np.add(self.hi, s, out=self.hi)
+        np.multiply(self.lo, -s, out=self.lo); np.add(self.lo, s + 1.0, out=self.lo)
+        np.greater_equal(self.rows, self.hi[:, None], out=self.a)
+        np.less_equal(self.rows, self.lo[:, None], out=self.b)
+        np.logical_and(self.a, self.b, out=self.a)
+        self.pixels.fill(self.bg)
+        self.pixels[:, h // 2] = self.mid
+        np.copyto(self.pixels, self.fg, where=self.a)
+        self._blit(surf, rect)
+
+    def draw_bars(self, surf, rect):
+        """Bars: light rows below each column's 0..1 height."""
+        h = self.pixels.shape[1]
+        np.multiply(self.hi, -(h - 1), out=self.hi)
+        np.add(self.hi, h - 1, out=self.hi)
+        np.greater_equal(self.rows, self.hi[:, None], out=self.a)
+        self.pixels.fill(self.bg)
+        np.copyto(self.pixels, self.fg, where=self.a)
+        self._blit(surf, rect)
@@ -1,6 +1,11 @@
+import time
 import pygame
+import functools
 import numpy as np
 from config import *
+from wavetable import bank
+from note_cache import disk_cache, SoundLRU
+from metrics import metrics
 
 # ---------------------- Utility ----------------------
 def midi_to_freq(m):
@@ -11,46 +16,174 @@ def note_name_to_midi(name, octave):
              'G':7, 'G#':8, 'A':9, 'A#':10, 'B':11}
     return 12 * (octave + 1) + names[name]
 
-def apply_envelope(wave, sample_rate, attack, decay, sustain_level, release):
-    env = np.ones_like(wave)
+@functools.lru_cache(maxsize=16)
+def env_ramps(sample_rate, attack, decay, sustain_level, release):
+    """Attack, decay and release ramps, built once per envelope setting and shared read-only."""
     a_samps = max(1, int(attack * sample_rate))
     d_samps = max(1, int(decay * sample_rate))
     r_samps = max(1, int(release * sample_rate))
-    env[:a_samps] = np.linspace(0, 1, a_samps)
-    env[a_samps:a_samps+d_samps] = np.linspace(1, sustain_level, d_samps)
-    sustain_start = a_samps + d_samps
-    sustain_end = len(env) - r_samps
-    if sustain_end > sustain_start:
-        env[sustain_start:sustain_end] = sustain_level
-    env[sustain_end:] = np.linspace(sustain_level, 0, len(env)-sustain_end)
-    return wave * env
-
-def gen_waveform(wave_type, freq, duration=2.5):
-    key = (wave_type, round(freq, 4), duration)
-    if key in sound_cache:
-        return sound_cache[key]
-    t = np.linspace(0, duration, int(SAMPLE_RATE * duration), endpoint=False)
-    if wave_type == WAVE_SINE:
-        wave = np.sin(2*np.pi*freq*t)
-    elif wave_type == WAVE_SQUARE:
-        wave = np.sign(np.sin(2*np.pi*freq*t))
-    else:
-        wave = 2.0 * (t*freq - np.floor(0.5 + t*freq))
-    wave = apply_envelope(wave, SAMPLE_RATE, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, 0.4)
-    wave = (wave * 32767).astype(np.int16)
-    stereo = np.column_stack((wave, wave))
-    sound = pygame.sndarray.make_sound(stereo.copy())
-    sound_cache[key] = sound
-    return sound
-
-def synth_note(wave_type, freq, duration, volume=1.0):
+    ramps = (np.linspace(0, 1, a_samps), np.linspace(1, sustain_level, d_samps),
+             np.linspace(sustain_level, 0, r_samps))
+    for r in ramps:
+        r.flags.writeable = False
+    return ramps
+
+def envelope(n_total, sample_rate, attack, decay, sustain_level, release, start=0, count=None):
+    """Envelope samples [start, start+count) of an n_total-sample note."""
+    if count is None:
+        count = n_total - start
+    a_ramp, d_ramp, r_ramp = env_ramps(sample_rate, attack, decay, sustain_level, release)
+    env = np.full(count, sustain_level, dtype=np.float64)
+    # attack, decay, then release last so it wins where a short note overlaps them
+    ramps = ((0, a_ramp), (len(a_ramp), d_ramp), (n_total - len(r_ramp), r_ramp))
+    end = start + count
+    for lo, ramp in ramps:
+        i0, i1 = max(lo, start), min(lo + len(ramp), end)
+        if i1 > i0:
+            env[i0-start:i1-start] = ramp[i0-lo:i1-lo]
+    return env
+
+def apply_envelope(wave, sample_rate, attack, decay, sustain_level, release):
+    return wave * envelope(len(wave), sample_rate, attack, decay, sustain_level, release)
+
+# ---------------------- Live note sounds ----------------------
+# A live note is a one-shot attack/decay segment followed by a short sustain
+# loop, both cut from one continuous render. The loop holds a whole number of
+# cycles (pitch nudged by a fraction of a cent to make that exact) and starts
+# on a cycle boundary, which is a zero crossing for every table, so neither
+# the attack->loop join nor the loop wrap clicks. The queued loop repeats it
+# for NOTE_HOLD_SECONDS so a stalled frame doesn't run it dry. Release is a
+# channel fadeout, handed over to a short tail when the playing Sound ends
+# first: see NoteSound.release().
+def note_layout(freq):
+    """(n_attack, n_loop, loop_freq) for a live note at freq."""
+    period = SAMPLE_RATE / freq
+    target = NOTE_LOOP_SECONDS * SAMPLE_RATE
+    cycles = np.arange(max(1, int(0.75 * target / period)), int(1.25 * target / period) + 2)
+    err = np.abs(cycles * period - np.round(cycles * period))
+    k = int(cycles[np.argmin(err)])
+    n_loop = int(round(k * period))
+    loop_freq = k * SAMPLE_RATE / n_loop
+    a_ramp, d_ramp, _ = env_ramps(SAMPLE_RATE, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE)
+    n_ad = len(a_ramp) + len(d_ramp)
+    n_attack = int(round(np.ceil(n_ad * loop_freq / SAMPLE_RATE) * SAMPLE_RATE / loop_freq))
+    return max(n_attack, n_ad), n_loop, loop_freq
+
+def render_note_buffer(wave_type, freq):
+    """Stereo int16 attack segment + sustain loop, back to back (split by note_layout)."""
+    n_attack, n_loop, loop_freq = note_layout(freq)
+    wave = bank.render(wave_type, loop_freq, n_attack + n_loop)
+    a_ramp, d_ramp, _ = env_ramps(SAMPLE_RATE, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE)
+    env = np.full(len(wave), ENV_SUSTAIN)
+    env[:len(a_ramp)] = a_ramp
+    env[len(a_ramp):len(a_ramp) + len(d_ramp)] = d_ramp
+    wave = (wave * env * 32767).astype(np.int16)
+    return np.column_stack((wave, wave))
+
+def note_buffer(wave_type, freq):
+    """Stereo int16 note buffer, memory-mapped from the disk cache when available."""
+    key = (wave_type, round(freq, 4))
+    if not USE_DISK_CACHE:
+        return render_note_buffer(wave_type, freq)
+    buf = disk_cache.load(key)
+    metrics.incr('disk_cache_miss' if buf is None else 'disk_cache_hit')
+    if buf is None:
+        buf = render_note_buffer(wave_type, freq)
+        try:
+            disk_cache.save(key, buf)
+        except OSError:
+            pass  # read-only/full disk: still play the note
+    return buf
+
+class NoteSound:
+    """Attack Sound and sustain loop Sound for one (wave, freq); release tails are cut per release."""
+    __slots__ = ('attack', 'loop', 'cycle', 'nbytes', 'started')
+
+    def __init__(self, buf, n_attack):
+        self.cycle = buf[n_attack:]   # whole cycles from a zero crossing (see note_layout)
+        reps = max(1, int(np.ceil(NOTE_HOLD_SECONDS * SAMPLE_RATE / len(self.cycle))))
+        loop = np.tile(self.cycle, (reps, 1))
+        self.attack = pygame.sndarray.make_sound(np.ascontiguousarray(buf[:n_attack]))
+        self.loop = pygame.sndarray.make_sound(loop)
+        self.nbytes = buf.nbytes + loop.nbytes
+        self.started = {}   # channel -> perf_counter() its attack started
+
+    def play(self):
+        ch = self.attack.play()
+        if ch:
+            ch.queue(self.loop)
+            self.started[ch] = time.perf_counter()
+        return ch
+
+    def keep_alive(self, ch):
+        """Re-queue the loop on ch once its queue has run dry (a queued Sound plays once)."""
+        playing = ch.get_sound()
+        if playing is None:
+            ch.play(self.loop)  # a frame stalled for longer than the whole loop
+            self.started[ch] = time.perf_counter() - self.attack.get_length()
+        elif playing is self.attack or playing is self.loop:
+            ch.queue(self.loop)
+
+    def _remaining(self, ch, playing):
+        """Seconds until the Sound playing on ch ends; back-to-back from its attack."""
+        t = time.perf_counter() - self.started.get(ch, time.perf_counter())
+        n_attack = self.attack.get_length()
+        if playing is self.attack:
+            return max(0.0, n_attack - t)
+        n_loop = self.loop.get_length()
+        return n_loop - (t - n_attack) % n_loop
+
+    def release(self, ch):
+        """Fade ch to silence over ENV_RELEASE, wherever in the attack or loop it is.
+
+        Channel.fadeout() keeps the queue: when the playing Sound ends, the queued
+        one starts at whatever volume the fade had reached and the fade is dropped
+        (and a fade that completes first restores full volume before the queue
+        plays). So a playing Sound that outlasts the release gets a silent queue;
+        one that ends first gets a tail, cut from the loop's start so it lands on
+        the cycle boundary, that takes the level the fade reached down to silence
+        by the end of the release.
+        """
+        playing = ch.get_sound()
+        if playing is not self.attack and playing is not self.loop:
+            self.started.pop(ch, None)
+            ch.fadeout(int(ENV_RELEASE * 1000))  # the tail (or nothing) is playing
+            return
+        left = self._remaining(ch, playing)
+        self.started.pop(ch, None)
+        if left >= ENV_RELEASE:
+            ch.queue(pygame.sndarray.make_sound(np.zeros((1, self.cycle.shape[1]), dtype=np.int16)))
+            ch.fadeout(int(ENV_RELEASE * 1000))
+            return
+        ramp = np.linspace(1.0, 0.0, max(1, int((ENV_RELEASE - left) * SAMPLE_RATE)))
+        tail = np.resize(self.cycle, (len(ramp), self.cycle.shape[1])) * ramp[:, None]
+        ch.queue(pygame.sndarray.make_sound(tail.astype(np.int16)))
+        # outlast the Sound even if it started a mixer buffer or two after play() was called
+        ch.fadeout(int(1000 * (ENV_RELEASE + 2 * AUDIO_BUFFER / SAMPLE_RATE)))
+
+sound_cache = SoundLRU(SOUND_CACHE_BYTES)
+
+def sound_key(wave_type, freq):
+    return (wave_type, round(freq, 4))
+
+def gen_waveform(wave_type, freq):
+    key = sound_key(wave_type, freq)
+    note = sound_cache.get(key)
+    if note is not None:
+        metrics.incr('sound_cache_hit')
+        return note
+    metrics.incr('sound_cache_miss')
+    note = NoteSound(note_buffer(wave_type, freq), note_layout(freq)[0])
+    evicted = sound_cache.put(key, note, note.nbytes)
+    if evicted:
+        metrics.incr('sound_cache_evict', evicted)
+    return note
+
+def synth_note(wave_type, freq, duration, volume=1.0, start=0, count=None):
+    """Offline note as float32; start/count render just that sample slice of it."""
     n_samps = max(1, int(SAMPLE_RATE * duration))
-    t = np.linspace(0, duration, n_samps, endpoint=False)
-    if wave_type == WAVE_SINE:
-        wave = np.sin(2*np.pi*freq*t)
-    elif wave_type == WAVE_SQUARE:
-        wave = np.sign(np.sin(2*np.pi*freq*t))
-    else:
-        wave = 2.0 * (t*freq - np.floor(0.5 + t*freq))
-    wave = apply_envelope(wave, SAMPLE_RATE, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE)
-    return (wave * volume).astype(np.float32)
\ No newline at end of file
+    if count is None:
+        count = n_samps - start
+    wave = bank.render(wave_type, freq, count, start=start)
+    wave *= envelope(n_samps, SAMPLE_RATE, ENV_ATTACK, ENV_DECAY, ENV_SUSTAIN, ENV_RELEASE, start, count)
+    return (wave * volume).astype(np.float32)
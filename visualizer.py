@@ -1,6 +1,8 @@
 # visualizer.py
 import pygame, time, math
 from config import *
+from metrics import metrics
+from scope import ScopeView
 
 # ------- Styling -------
 NOTE_COLORS = {
@@ -26,14 +28,37 @@ ROW_GAP     = 18    # gap between lower & upper rows
 KEY_GAP     = 5
 CARD_PAD    = 16
 
+def _mix(under, over, alpha):
+    a = alpha / 255
+    return tuple(int(u + (o - u) * a) for u, o in zip(under, over))
+
 class Visualizer:
-    """Reactive UI with: top level meter, centered two-row keyboard card, bottom status."""
+    """Reactive UI with: top level meter, centered two-row keyboard card, bottom status.
+
+    The static parts (background, meter track, card and keys) are pre-rendered
+    once per layout. With VIZ_DIRTY_RECTS, draw() only repaints the keys that
+    are or just were lit, the meter and the status area, and returns those
+    rects for pygame.display.update(); otherwise it repaints the whole window.
+    `quality` is a frame_budget tier: from 1 glows are flat fills instead of
+    alpha blends, from 2 they stop breathing and only changed keys repaint.
+    """
     def __init__(self, surface, keymap):
         self.surf = surface
         self.keymap = keymap
         self.active = {}  # keycode -> dict(start, freq, wave, volume, release?)
         self.last_frame_time = time.time()
         self.fps_smooth = 60.0
+        self.fps_shown, self._fps_at = 60.0, 0.0  # status FPS refreshes 4x/s, not every frame
+        self.show_metrics = False  # F3 overlay
+        self._metrics_lines, self._metrics_at = [], 0.0
+        self.dirty_rects = VIZ_DIRTY_RECTS
+        self._fonts = {}   # (name, size) -> Font
+        self._glows = {}   # (color, size, alpha bucket) -> SRCALPHA surface
+        self._accents = {} # color -> thin accent surface
+        self._flats = {}   # (color, is_black, alpha bucket) -> opaque glow for quality >= 1
+        self.quality = 0   # frame_budget tier; set with set_quality()
+        self.scope = None  # ScopeView while the F4 panels are on
+        self._scope_ring = None
 
         # dynamic geometry (computed on resize/init)
         self._compute_layout()
@@ -42,6 +67,23 @@ class Visualizer:
         self.keymap = keymap
         # positions depend on width; keep the same layout (no need to recompute rows)
 
+    def set_quality(self, tier):
+        if tier != self.quality:
+            self.quality = tier
+            self._need_full = True  # repaint every glow in the new style
+
+    def set_scope(self, ring):
+        """Show oscilloscope/spectrum panels fed from a ScopeRing, or hide them (None)."""
+        self._scope_ring = ring
+        self.scope = None
+        if ring is not None:
+            card = self.kb_card
+            left = pygame.Rect(16, card.y, card.x - 32, card.h)
+            right = pygame.Rect(card.right + 16, card.y, self._w - card.right - 32, card.h)
+            if left.width > 8 and right.width > 8:
+                self.scope = ScopeView(ring, left, right)
+        self._need_full = True  # paint (or clear) the panel areas
+
     # ---------- Public hooks ----------
     def note_on(self, key, freq, wave, volume):
         now = time.time()
@@ -64,6 +106,8 @@ class Visualizer:
         dt = now - self.last_frame_time
         self.last_frame_time = now
         self.fps_smooth = 0.92*self.fps_smooth + 0.08*(1.0/max(1e-5, dt))
+        if now - self._fps_at > 0.25:
+            self.fps_shown, self._fps_at = self.fps_smooth, now
 
         # remove visuals after release + ENV_RELEASE
         to_del = []
@@ -74,18 +118,65 @@ class Visualizer:
         for k in to_del:
             self.active.pop(k, None)
 
-    def draw(self, octave, wave, volume, sustain, rec_on, status_msg=""):
+    def draw(self, octave, wave, volume, sustain, rec_on, status_msg="", progress=None):
+        """Draw one frame and return the changed rects (for pygame.display.update)."""
         w, h = self.surf.get_size()
         # If window changed, recompute geometry once
         if (w, h) != (self._w, self._h):
             self._compute_layout()
 
-        self.surf.fill(BG)
-        self._draw_top_meter()
-        self._draw_keyboard_card()
-        self._draw_status(octave, wave, volume, sustain, rec_on, status_msg)
-
-        pygame.display.flip()
+        if self.show_metrics and time.time() - self._metrics_at > 0.25:
+            # percentiles are refreshed 4x per second; cheap enough to leave on while playing
+            self._metrics_lines, self._metrics_at = metrics.overlay_lines(), time.time()
+        if progress is not None:
+            progress = (progress[0], int(100 * progress[1]))  # repaint the status area once per percent
+        status = (octave, wave, volume, sustain, rec_on, status_msg, int(self.fps_shown), progress,
+                  tuple(self._metrics_lines) if self.show_metrics else ())
+        meter = self._meter_state()
+        full = not self.dirty_rects or self._need_full
+
+        dirty = []
+        if full:
+            self.surf.blit(self._static, (0, 0))
+            dirty.append(self.surf.get_rect())
+        if full or meter != self._last_meter:
+            self._draw_top_meter(meter)
+            dirty.append(self.meter_rect)
+        # keys lit now or last frame: restore them from the static layer, then glow the lit ones
+        looks = {k: (ev["wave"], ev["volume"]) for k, ev in self.active.items() if k in self.rows}
+        keys = set(looks) | set(self._last_looks)
+        animate = self.quality < 2
+        if not animate:  # still glows: only keys that lit, went out or changed colour
+            keys = {k for k in keys if looks.get(k) != self._last_looks.get(k)}
+            # white and black key rects overlap: restoring one wipes part of a lit neighbour,
+            # so redo lit neighbours too (and theirs), in the same order a full draw uses
+            more = keys
+            while more and not full:
+                rects = [self._key_rect(k) for k in more]
+                more = {k for k in looks if k not in keys and self._key_rect(k).collidelist(rects) >= 0}
+                keys |= more
+        if keys and not full:
+            for k in keys:
+                r = self._key_rect(k)
+                if r:
+                    self.surf.blit(self._static, r, r)
+                    dirty.append(r)
+        self._draw_keyboard_card(None if full or animate else keys)
+        if self.scope is not None:
+            with metrics.timer('scope'):
+                dirty += self.scope.draw(self.surf)
+        if full or status != self._last_status:
+            if not full:
+                self.surf.blit(self._static, self.status_rect, self.status_rect)
+                dirty.append(self.status_rect)
+            self._draw_status(octave, wave, volume, sustain, rec_on, status_msg, progress)
+            if self.show_metrics:
+                self._draw_metrics()
+
+        self._need_full = False
+        self._last_meter, self._last_status = meter, status
+        self._last_looks = looks
+        return dirty
 
     # ---------- Geometry ----------
     def _compute_layout(self):
@@ -114,9 +205,71 @@ class Visualizer:
 
         # Status text baseline (always BELOW the keyboard card)
         self.status_y = self.kb_card.bottom + BOTTOM_PAD
+        self.meter_rect = pygame.Rect(16, TOP_PAD, self._w-32, TOP_BAR_H)
+        self.status_rect = pygame.Rect(0, self.status_y, self._w, self._h - self.status_y)
+
+        self._build_static()
+        if self._scope_ring is not None:
+            self.set_scope(self._scope_ring)
+        self._need_full = True
+        self._last_looks, self._last_meter, self._last_status = {}, None, None
+
+    def _build_static(self):
+        """Everything that only changes with the layout, pre-rendered once."""
+        self._static = pygame.Surface((self._w, self._h), 0, self.surf)  # same pixel format: fast blits
+        self._static.fill(BG)
+        pygame.draw.rect(self._static, (40,40,40), self.meter_rect, border_radius=8)
+        pygame.draw.rect(self._static, CARD, self.kb_card, border_radius=14)
+        pygame.draw.rect(self._static, OUTL, self.kb_card, width=1, border_radius=14)
+        # lower & upper rows (whites first, then blacks for layering)
+        self._draw_row(self._static, self.lower_y, lower=True)
+        self._draw_row(self._static, self.upper_y, lower=False)
+
+    def _key_rect(self, keycode):
+        pos = self.rows.get(keycode)
+        if not pos:
+            return None
+        x, y, is_black = pos
+        return pygame.Rect(x, y, KEY_W, KEY_H if not is_black else KEY_H//2)
+
+    # ---------- Cached resources ----------
+    def _font(self, name, size):
+        f = self._fonts.get((name, size))
+        if f is None:
+            f = self._fonts[(name, size)] = pygame.font.SysFont(name, size)
+        return f
+
+    def _glow(self, col, size, alpha):
+        key = (col, size, alpha // 8)  # 32 alpha buckets are visually indistinguishable from 256
+        s = self._glows.get(key)
+        if s is None:
+            s = pygame.Surface(size, pygame.SRCALPHA)
+            pygame.draw.rect(s, (*col, (alpha // 8) * 8), s.get_rect(), border_radius=6)
+            self._glows[key] = s
+        return s
+
+    def _accent(self, col):
+        s = self._accents.get(col)
+        if s is None:
+            s = self._accents[col] = pygame.Surface((KEY_W, 3), pygame.SRCALPHA)
+            s.fill((*col, 200))
+        return s
+
+    def _flat(self, col, is_black, alpha):
+        """Glow + accent pre-mixed with the key face into an opaque surface (no per-pixel alpha)."""
+        key = (col, is_black, alpha // 8)
+        s = self._flats.get(key)
+        if s is None:
+            face = BLACK if is_black else WHITE
+            key_h = KEY_H if not is_black else KEY_H//2
+            # inset 2px so the square corners stay inside the key's rounded outline
+            s = self._flats[key] = pygame.Surface((KEY_W - 4, key_h - 4), 0, self.surf)
+            s.fill(_mix(face, col, (alpha // 8) * 8))
+            s.fill(_mix(face, col, 200), (0, key_h - 8, KEY_W - 4, 3))
+        return s
 
     # ---------- Drawing pieces ----------
-    def _draw_top_meter(self):
+    def _meter_state(self):
         # blend color by active waves & amplitude
         total_amp, mix = 0.0, [0,0,0]
         for ev in self.active.values():
@@ -124,55 +277,51 @@ class Visualizer:
             c = NOTE_COLORS.get(ev["wave"], (200,200,200))
             mix[0]+=c[0]*a; mix[1]+=c[1]*a; mix[2]+=c[2]*a
         col = (int(mix[0]/total_amp), int(mix[1]/total_amp), int(mix[2]/total_amp)) if total_amp>0 else GREY
+        return col, int(self.meter_rect.width * min(1.0, total_amp * 0.9))
 
-        bg = pygame.Rect(16, TOP_PAD, self._w-32, TOP_BAR_H)
-        pygame.draw.rect(self.surf, (40,40,40), bg, border_radius=8)
-        fill = bg.copy()
-        fill.width = int(bg.width * min(1.0, total_amp * 0.9))
+    def _draw_top_meter(self, state):
+        col, width = state
+        self.surf.blit(self._static, self.meter_rect, self.meter_rect)
+        fill = self.meter_rect.copy()
+        fill.width = width
         pygame.draw.rect(self.surf, col, fill, border_radius=8)
 
-    def _draw_keyboard_card(self):
-        # card
-        pygame.draw.rect(self.surf, CARD, self.kb_card, border_radius=14)
-        pygame.draw.rect(self.surf, OUTL, self.kb_card, width=1, border_radius=14)
-
-        # lower & upper rows (whites first, then blacks for layering)
-        self._draw_row(self.lower_y, lower=True)
-        self._draw_row(self.upper_y, lower=False)
-
-        # active glow overlays
-        breath = 0.55 + 0.45*math.sin(time.time()*7.5)
+    def _draw_keyboard_card(self, keys=None):
+        # card and keys come from the static layer; only the active glow overlays are drawn
+        # (for `keys` only, when given)
+        breath = 0.55 + 0.45*math.sin(time.time()*7.5) if self.quality < 2 else 1.0
+        blend = self.quality < 1
         for keycode, ev in self.active.items():
             pos = self.rows.get(keycode)
-            if not pos: continue
+            if not pos or (keys is not None and keycode not in keys): continue
             x,y,is_black = pos
             col = NOTE_COLORS.get(ev["wave"], (220,220,220))
-            alpha = int(110 + 145*breath*ev["volume"])
-            s = pygame.Surface((KEY_W, KEY_H if not is_black else KEY_H//2), pygame.SRCALPHA)
-            pygame.draw.rect(s, (*col, max(60, alpha)), s.get_rect(), border_radius=6)
-            self.surf.blit(s, (x, y))
-            # thin accent line
-            thin = pygame.Surface((KEY_W, 3), pygame.SRCALPHA)
-            thin.fill((*col, 200))
-            self.surf.blit(thin, (x, y + (KEY_H if not is_black else KEY_H//2) - 6))
-
-    def _draw_row(self, y, lower=True):
+            alpha = max(60, int(110 + 145*breath*ev["volume"]))
+            key_h = KEY_H if not is_black else KEY_H//2
+            if blend:
+                self.surf.blit(self._glow(col, (KEY_W, key_h), alpha), (x, y))
+                # thin accent line
+                self.surf.blit(self._accent(col), (x, y + key_h - 6))
+            else:
+                self.surf.blit(self._flat(col, is_black, alpha), (x + 2, y + 2))
+
+    def _draw_row(self, surf, y, lower=True):
         # White keys
         for i in range(10):
             x = self.kb_left + i*(KEY_W+KEY_GAP)
-            pygame.draw.rect(self.surf, WHITE, (x,y,KEY_W,KEY_H), border_radius=6)
-            pygame.draw.rect(self.surf, OUTL,  (x,y,KEY_W,KEY_H), width=1, border_radius=6)
+            pygame.draw.rect(surf, WHITE, (x,y,KEY_W,KEY_H), border_radius=6)
+            pygame.draw.rect(surf, OUTL,  (x,y,KEY_W,KEY_H), width=1, border_radius=6)
         # Black keys (positions 0,1,3,4,5)
         black_slots = [0,1,3,4,5]
         base_y = y - 2
         for idx in black_slots:
             x = self.kb_left + idx*(KEY_W+KEY_GAP) + KEY_W - KEY_W//3
-            pygame.draw.rect(self.surf, BLACK, (x,base_y,KEY_W,KEY_H//2), border_radius=6)
-            pygame.draw.rect(self.surf, OUTL,  (x,base_y,KEY_W,KEY_H//2), width=1, border_radius=6)
+            pygame.draw.rect(surf, BLACK, (x,base_y,KEY_W,KEY_H//2), border_radius=6)
+            pygame.draw.rect(surf, OUTL,  (x,base_y,KEY_W,KEY_H//2), width=1, border_radius=6)
 
-    def _draw_status(self, octave, wave, volume, sustain, rec_on, status_msg):
-        font = pygame.font.SysFont(None, 22)
-        info = f"Octave {octave} | Wave {['Sine','Square','Saw'][wave]} | Vol {volume:.2f} | Sustain {'ON' if sustain else 'OFF'} | FPS {self.fps_smooth:,.0f}"
+    def _draw_status(self, octave, wave, volume, sustain, rec_on, status_msg, progress=None):
+        font = self._font(None, 22)
+        info = f"Octave {octave} | Wave {['Sine','Square','Saw'][wave]} | Vol {volume:.2f} | Sustain {'ON' if sustain else 'OFF'} | FPS {self.fps_shown:,.0f}"
         img  = font.render(info, True, (230,230,230))
         self.surf.blit(img, (16, self.status_y))
 
@@ -184,6 +333,24 @@ class Visualizer:
         if status_msg:
             sm = font.render(status_msg, True, (180,220,180))
             self.surf.blit(sm, (16, self.status_y + 24))
+        if progress is not None:
+            # (label, percent) bar, right-aligned under REC
+            bar = pygame.Rect(self._w - 16 - 160, self.status_y + 28, 160, 10)
+            pygame.draw.rect(self.surf, OUTL, bar, width=1, border_radius=4)
+            fill = bar.inflate(-4, -4)
+            label, pct = progress
+            fill.width = int(fill.width * pct / 100)
+            if fill.width:
+                pygame.draw.rect(self.surf, RED, fill, border_radius=3)
+            pct = self._font(None, 18).render(f"{label} {pct}%", True, GREY)
+            self.surf.blit(pct, (bar.x - 8 - pct.get_width(), self.status_y + 25))
+
+    def _draw_metrics(self):
+        font = self._font("monospace", 13)
+        y = self.status_y + 46
+        for line in self._metrics_lines:
+            self.surf.blit(font.render(line, True, (150,150,150)), (16, y))
+            y += 13
 
     # ---------- Key positions (for highlighting) ----------
     def _compute_rows_positions(self):
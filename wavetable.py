@@ -0,0 +1,72 @@
+import numpy as np
+from config import *
+
+# ---------------------- Wavetable oscillators ----------------------
+# One cycle per waveform is precomputed once; notes are rendered by a phase
+# accumulator reading the table with linear interpolation. Square and saw get
+# band-limited mip levels (fewer harmonics per level) so high notes don't alias.
+TABLE_SIZE = 2048
+
+def _harmonics(wave_type, max_harm):
+    k = np.arange(1, max_harm + 1)
+    if wave_type == WAVE_SINE:
+        amps = (k == 1).astype(np.float64)
+    elif wave_type == WAVE_SQUARE:
+        amps = np.where(k % 2 == 1, 4.0 / (np.pi * k), 0.0)
+    else:
+        # matches the naive saw 2*(x - floor(0.5 + x)): rising, wraps at half cycle
+        amps = (2.0 / np.pi) * np.where(k % 2 == 1, 1.0, -1.0) / k
+    return k, amps
+
+def _build_table(wave_type, max_harm, size):
+    spec = np.zeros(size // 2 + 1, dtype=np.complex128)
+    k, amps = _harmonics(wave_type, max_harm)
+    spec[k] = -0.5j * size * amps          # irfft of this is sum(amps * sin(2*pi*k*x))
+    table = np.fft.irfft(spec, size)
+    table /= np.max(np.abs(table))         # full scale without Gibbs overshoot clipping
+    return np.append(table, table[0])      # guard point so idx+1 never wraps
+
+class Wavetable:
+    """Per-waveform single-cycle tables with octave-spaced band-limited mip levels."""
+    def __init__(self, sample_rate=SAMPLE_RATE, size=TABLE_SIZE):
+        self.sample_rate = sample_rate
+        self.size = size
+        self.n_levels = int(np.log2(size // 2)) + 1
+        # level i holds (size//2) >> i harmonics; sine only needs one level
+        self.tables = {WAVE_SINE: [_build_table(WAVE_SINE, 1, size)]}
+        for w in (WAVE_SQUARE, WAVE_SAW):
+            self.tables[w] = [_build_table(w, (size // 2) >> i, size) for i in range(self.n_levels)]
+        # every table stacked as rows of one array, for vectorized multi-voice lookup
+        self.stack = np.stack([t for w in (WAVE_SINE, WAVE_SQUARE, WAVE_SAW) for t in self.tables[w]])
+        self._row0 = {WAVE_SINE: 0, WAVE_SQUARE: 1, WAVE_SAW: 1 + self.n_levels}
+
+    def _level(self, wave_type, freq):
+        if wave_type == WAVE_SINE:
+            return 0
+        max_harm = max(1, int(0.5 * self.sample_rate / max(freq, 1e-6)))
+        level = int(np.ceil(np.log2((self.size // 2) / max_harm)))
+        return min(max(level, 0), self.n_levels - 1)
+
+    def table_for(self, wave_type, freq):
+        wave_type = wave_type if wave_type in self.tables else WAVE_SAW
+        return self.tables[wave_type][self._level(wave_type, freq)]
+
+    def table_id(self, wave_type, freq):
+        """Row of self.stack that table_for() would return."""
+        wave_type = wave_type if wave_type in self.tables else WAVE_SAW
+        return self._row0[wave_type] + self._level(wave_type, freq)
+
+    def render(self, wave_type, freq, n_samps, start=0, phase=0.0):
+        """Samples [start, start+n_samps) of an oscillator that is at `phase` (cycles) at sample 0."""
+        table = self.table_for(wave_type, freq)
+        inc = freq / self.sample_rate
+        pos = phase + inc * np.arange(start, start + n_samps, dtype=np.float64)
+        pos -= np.floor(pos)
+        pos *= self.size
+        idx = pos.astype(np.intp)
+        frac = pos - idx
+        out = table[idx]
+        out += (table[idx + 1] - out) * frac
+        return out
+
+bank = Wavetable()